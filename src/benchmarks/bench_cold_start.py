@@ -0,0 +1,78 @@
+'''
+Cold start benchmark.
+Measures module import and first invocation time of each handler in a fresh interpreter,
+with botocore requests answered by stub responses instead of AWS.
+
+Usage (from the src folder): python -m benchmarks.bench_cold_start [runs]
+'''
+import os
+import sys
+import json
+import subprocess
+
+# Executed in a fresh interpreter for each run
+SCRIPT = r'''
+import json, sys, time, datetime
+import boto3
+from botocore.awsrequest import AWSResponse
+START = datetime.datetime.utcnow()
+TASK = {'taskArn': 'arn:aws:ecs:us-west-2:123456789012:task/1', 'lastStatus': 'STOPPED',
+        'containers': [{'name': 'app', 'exitCode': 0, 'lastStatus': 'STOPPED'}]}
+RESPONSES = {
+  'RunTask': {'tasks': [TASK], 'failures': []},
+  'DescribeTasks': {'tasks': [TASK], 'failures': []},
+}
+def stub(model, **kwargs):
+  return (AWSResponse(None, 200, {}, None), dict(RESPONSES[model.name], ResponseMetadata={}))
+boto3.setup_default_session()
+boto3.DEFAULT_SESSION.events.register('before-call.ecs', stub)
+class Context(object):
+  def get_remaining_time_in_millis(self):
+    return 300000
+started = time.time()
+module = __import__(sys.argv[1])
+imported = time.time()
+event = {'Cluster': 'cluster', 'TaskDefinition': 'task:1', 'Count': 1,
+         'Tasks': [TASK], 'CreateTimestamp': START.isoformat() + 'Z'}
+if sys.argv[1] == 'ecs_tasks':
+  event = {'StackId': 'stack', 'LogicalResourceId': 'Task', 'RequestType': 'Create', 'CreationTime': int(time.time()),
+           'ResourceProperties': {'Cluster': 'cluster', 'TaskDefinition': 'task:1'}}
+  result = module.handle_create(event, Context())
+else:
+  result = module.handler(event, Context())
+assert result.get('Status') != 'FAILED', result
+invoked = time.time()
+print(json.dumps({'import': imported - started, 'invoke': invoked - imported}))
+'''
+
+# Environment for each run - fake credentials ensure no request can reach AWS
+ENVIRONMENT = dict(os.environ,
+  AWS_DEFAULT_REGION='us-west-2',
+  AWS_ACCESS_KEY_ID='testing',
+  AWS_SECRET_ACCESS_KEY='testing',
+  LOG_LEVEL='WARNING',
+  PYTHONWARNINGS='ignore'
+)
+
+HANDLERS = ['create_task', 'check_task', 'ecs_tasks']
+
+def run(handler):
+  output = subprocess.check_output([sys.executable, '-c', SCRIPT, handler], env=ENVIRONMENT)
+  return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+def median(values):
+  values = sorted(values)
+  return values[len(values) // 2]
+
+def main(runs):
+  print('%-12s %12s %12s' % ('handler', 'import (ms)', 'invoke (ms)'))
+  for handler in HANDLERS:
+    results = [run(handler) for _ in range(runs)]
+    print('%-12s %12.1f %12.1f' % (
+      handler,
+      median([r['import'] for r in results]) * 1000,
+      median([r['invoke'] for r in results]) * 1000
+    ))
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,212 @@
+'''
+Handler benchmark against the in-process fake ECS and CloudFormation backends.
+Drives the custom resource (create, update, delete and poll) and Step Functions (create_task and check_task)
+handlers for a number of resources, skipping over simulated waits, and reports per scenario the API calls made,
+throttled requests, wall time, billed Lambda time (including simulated waits), time spent sleeping and the largest state payload.
+
+Usage (from the src folder): python -m benchmarks.bench_handlers [--resources N] [--count N] [--latency S] ...
+'''
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+
+import mock
+from cfn_lambda_handler import CfnLambdaExecutionTimeout
+from .fake_aws import Clock, FakeEcs, FakeCloudFormation, REAL_TIME
+import ecs_tasks
+import create_task
+import check_task
+from lib import throttle, scheduler
+from lib.formatting import format_json
+from lib.metrics import MemorySink, set_sink
+from lib.ecs import TASK_DEFINITION_CACHE, CONTAINER_INSTANCE_CACHE
+from lib.cfn import STACK_STATUS_CACHE
+
+STACK_ID = 'arn:aws:cloudformation:us-west-2:123456789012:stack/my-stack/00000000-0000-0000-0000-000000000000'
+
+class Context(object):
+  """Lambda context whose remaining time follows the simulated clock"""
+  function_name = 'ecsTasks'
+
+  def __init__(self, clock, timeout):
+    self.clock = clock
+    self.deadline = clock.time() + timeout
+
+  def get_remaining_time_in_millis(self):
+    return int((self.deadline - self.clock.time()) * 1000)
+
+class Stats(object):
+  """Invocation, timing and payload totals for a scenario"""
+  def __init__(self, clock):
+    self.clock = clock
+    self.invocations = 0
+    self.wall = 0
+    self.billed = 0
+    self.payload = 0
+
+  def invoke(self, func, event, timeout):
+    context = Context(self.clock, timeout)
+    started, simulated = REAL_TIME(), self.clock.time()
+    try:
+      return func(event, context)
+    finally:
+      self.invocations += 1
+      self.wall += REAL_TIME() - started
+      self.billed += self.clock.time() - simulated
+
+  # Records the size of state passed between invocations, returning the state as it would be deserialized
+  def record_payload(self, data):
+    payload = format_json(data)
+    self.payload = max(self.payload, len(payload))
+    return json.loads(payload)
+
+def resource_event(request_type, index, options, task_definition='app:2'):
+  event = {
+    'RequestType': request_type,
+    'StackId': STACK_ID,
+    'LogicalResourceId': 'Task%d' % index,
+    'CreationTime': int(time.time()),
+    'StackStatus': 'UNKNOWN',
+    'ResourceProperties': {
+      'Cluster': 'cluster',
+      'TaskDefinition': task_definition,
+      'Count': str(options.count),
+      'Timeout': '3600',
+      'RunOnRollback': 'False',
+      'UpdateCriteria': [{'Container': 'app', 'EnvironmentKeys': ['VERSION']}]
+    }
+  }
+  if request_type == 'Update':
+    event['OldResourceProperties'] = dict(event['ResourceProperties'], TaskDefinition='app:1')
+  return event
+
+# Invokes a custom resource handler, re-invoking the poll handler with the saved state until the tasks complete
+def invoke_resource(stats, handler, event, options):
+  while True:
+    try:
+      result = stats.record_payload(stats.invoke(handler, event, options.lambda_timeout))
+      assert result.get('Status') != 'FAILED', result.get('Reason')
+      return result
+    except CfnLambdaExecutionTimeout as e:
+      handler = ecs_tasks.handle_poll
+      event = {'RequestType': event['RequestType'], 'EventStatus': 'Poll', 'EventState': stats.record_payload(e.state)}
+
+def scenario_create(stats, options):
+  for i in range(options.resources):
+    invoke_resource(stats, ecs_tasks.handle_create, resource_event('Create', i, options), options)
+
+def scenario_update(stats, options):
+  for i in range(options.resources):
+    invoke_resource(stats, ecs_tasks.handle_update, resource_event('Update', i, options), options)
+
+# Deletes resources whose tasks are still running
+def scenario_delete(stats, options):
+  stats.ecs.run_time = 86400
+  for i in range(options.resources):
+    event = resource_event('Delete', i, options)
+    started_by = ecs_tasks.get_task_id(event['StackId'], event['LogicalResourceId'])
+    stats.ecs.create_tasks('cluster', 'app:2', {}, options.count, started_by)
+    invoke_resource(stats, ecs_tasks.handle_delete, event, options)
+    running = [t for t in stats.ecs.tasks.values() if t['startedBy'] == started_by and not t['stopped']]
+    assert not running, '%d tasks left running' % len(running)
+
+def scenario_step_functions(stats, options):
+  for i in range(options.resources):
+    event = {'Cluster': 'cluster', 'TaskDefinition': 'app:2', 'Count': options.count, 'StartedBy': 'bench-%d' % i}
+    event = stats.record_payload(stats.invoke(create_task.handler, event, options.lambda_timeout))
+    while event['Status'] not in ['STOPPED', 'FAILED']:
+      stats.clock.sleep(options.wait)
+      event = stats.record_payload(stats.invoke(check_task.handler, event, options.lambda_timeout))
+    assert event['Status'] == 'STOPPED', event.get('Reason')
+
+SCENARIOS = [
+  ('cfn create', scenario_create),
+  ('cfn update', scenario_update),
+  ('cfn delete', scenario_delete),
+  ('step functions', scenario_step_functions)
+]
+
+# Resets state shared across warm invocations, so that each scenario starts cold
+def reset():
+  for cache in [TASK_DEFINITION_CACHE, CONTAINER_INSTANCE_CACHE, STACK_STATUS_CACHE]:
+    cache.clear()
+  throttle.BUCKETS.clear()
+  scheduler.OBSERVED_TIMINGS.clear()
+
+def run(name, func, options):
+  clock = Clock()
+  service = dict(latency=options.latency, rate=options.rate, burst=options.burst)
+  ecs = FakeEcs(clock, pending_time=options.pending_time, run_time=options.run_time, **service)
+  cfn = FakeCloudFormation(clock, **service)
+  stats = Stats(clock)
+  stats.ecs = ecs
+  reset()
+  for module in [ecs_tasks, create_task, check_task]:
+    module.task_mgr.client = ecs
+  ecs_tasks.cfn_mgr.client = cfn
+  sink = MemorySink()
+  previous = set_sink(sink)
+  try:
+    with mock.patch('time.time', clock.time), mock.patch('time.sleep', clock.sleep):
+      func(stats, options)
+  finally:
+    set_sink(previous)
+  calls = ecs.calls + cfn.calls
+  if options.verbose:
+    for operation in sorted(calls):
+      print('  %-28s %6d' % (operation, calls[operation]))
+  return {
+    'scenario': name,
+    'invocations': stats.invocations,
+    'api_calls': sum(calls.values()),
+    'throttled': sum((ecs.throttles + cfn.throttles).values()),
+    'wall': stats.wall,
+    'lambda_seconds': stats.billed,
+    'sleep_seconds': sum(m.get('sleep.Time', 0) for m in sink.summaries) / 1000,
+    'max_payload': stats.payload
+  }
+
+def parse_args(args):
+  parser = argparse.ArgumentParser(description='Benchmarks handlers against a simulated ECS and CloudFormation backend')
+  parser.add_argument('--resources', type=int, default=10, help='custom resources or state machine executions per scenario')
+  parser.add_argument('--count', type=int, default=20, help='tasks started per resource')
+  parser.add_argument('--pending-time', type=float, default=30, help='simulated seconds before each task is running')
+  parser.add_argument('--run-time', type=float, default=120, help='simulated seconds each task runs for')
+  parser.add_argument('--latency', type=float, default=0.005, help='real seconds each API request takes')
+  parser.add_argument('--rate', type=float, default=20, help='fake API requests per second per operation before throttling')
+  parser.add_argument('--burst', type=int, default=50, help='fake API request burst size per operation')
+  parser.add_argument('--lambda-timeout', type=float, default=300, help='simulated Lambda timeout in seconds')
+  parser.add_argument('--wait', type=float, default=10, help='simulated seconds between Step Functions checks')
+  parser.add_argument('--scenario', action='append', help='scenario to run (default all)')
+  parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+  parser.add_argument('--verbose', action='store_true', help='print API calls per operation')
+  return parser.parse_args(args)
+
+def main(args):
+  options = parse_args(args)
+  logging.getLogger().setLevel(logging.ERROR)
+  if not options.json:
+    print('%-16s %6s %8s %9s %9s %11s %10s %12s' % (
+      'scenario', 'invoc', 'calls', 'throttled', 'wall (s)', 'lambda (s)', 'sleep (s)', 'payload (B)'
+    ))
+  results = []
+  for name, func in SCENARIOS:
+    if options.scenario and name not in options.scenario:
+      continue
+    result = run(name, func, options)
+    results.append(result)
+    if options.json:
+      print(json.dumps(result))
+    else:
+      print('%-16s %6d %8d %9d %9.2f %11.1f %10.1f %12d' % (
+        name, result['invocations'], result['api_calls'], result['throttled'],
+        result['wall'], result['lambda_seconds'], result['sleep_seconds'], result['max_payload']
+      ))
+  return results
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,50 @@
+'''
+Micro-benchmark of per-event validation cost.
+Compares building the voluptuous schema on every call against the validators compiled at import.
+
+Usage (from the src folder): python -m benchmarks.bench_validation [iterations]
+'''
+import sys
+import timeit
+from lib.validation import get_cfn_validator, get_ecs_validator, validate_cfn, validate_ecs
+
+# Typical custom resource properties with string only overrides
+CFN_EVENT = {
+  'Cluster': 'my-stack-ApplicationCluster',
+  'TaskDefinition': 'arn:aws:ecs:us-west-2:123456789012:task-definition/my-stack-AdhocTaskDefinition:1',
+  'Count': '1',
+  'Timeout': '1800',
+  'RunOnUpdate': 'True',
+  'UpdateCriteria': [{'Container': 'app', 'EnvironmentKeys': ['DB_HOST']}],
+  'Overrides': {
+    'containerOverrides': [{
+      'name': 'app',
+      'command': ['manage.py', 'migrate'],
+      'environment': [{'name': 'VAR_%d' % i, 'value': 'value'} for i in range(20)]
+    }]
+  }
+}
+
+# Typical Step Functions check event
+ECS_EVENT = {
+  'Cluster': 'my-stack-ApplicationCluster',
+  'TaskDefinition': 'my-stack-AdhocTaskDefinition',
+  'Count': 1,
+  'Overrides': CFN_EVENT['Overrides'],
+  'Tasks': [{'taskArn': 'arn:aws:ecs:us-west-2:123456789012:task/%d' % i} for i in range(10)]
+}
+
+CASES = [
+  ('cfn per-call schema', lambda: get_cfn_validator()(CFN_EVENT)),
+  ('cfn compiled', lambda: validate_cfn(CFN_EVENT)),
+  ('ecs per-call schema', lambda: get_ecs_validator()(ECS_EVENT)),
+  ('ecs compiled', lambda: validate_ecs(ECS_EVENT)),
+]
+
+def main(iterations):
+  for name, func in CASES:
+    elapsed = min(timeit.repeat(func, number=iterations, repeat=3))
+    print('%-22s %8.1f us/event' % (name, elapsed / iterations * 1e6))
+
+if __name__ == '__main__':
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
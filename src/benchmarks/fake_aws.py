@@ -0,0 +1,237 @@
+'''
+In-process fake ECS and CloudFormation backends for offline benchmarks.
+Tasks move through PENDING, RUNNING and STOPPED on a simulated clock, API requests are paginated and
+throttled per operation like the real services, and each request waits for a fixed latency.
+'''
+import re
+import time
+import threading
+import itertools
+from collections import Counter
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+REAL_TIME = time.time
+REAL_SLEEP = time.sleep
+
+# Page sizes of the real list operations
+LIST_PAGE_SIZE = 100
+
+class Clock(object):
+  """Simulated clock that follows real time, but skips ahead rather than sleeping"""
+  def __init__(self):
+    self.skipped = 0
+    self.lock = threading.Lock()
+
+  def time(self):
+    return REAL_TIME() + self.skipped
+
+  def sleep(self, seconds):
+    with self.lock:
+      self.skipped += max(seconds, 0)
+
+class Limit(object):
+  """Token bucket that rejects requests rather than waiting for tokens"""
+  def __init__(self, clock, rate, burst):
+    self.clock = clock
+    self.rate = float(rate)
+    self.burst = burst
+    self.tokens = burst
+    self.updated = clock.time()
+    self.lock = threading.Lock()
+
+  def take(self):
+    with self.lock:
+      now = self.clock.time()
+      self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+      self.updated = now
+      if self.tokens < 1:
+        return False
+      self.tokens -= 1
+      return True
+
+def client_error(code, operation, message=None):
+  return ClientError({'Error': {'Code': code, 'Message': message or code}}, operation)
+
+class FakeService(object):
+  """Counts, delays and throttles requests to a fake AWS service"""
+  def __init__(self, clock, latency=0.01, rate=20, burst=50):
+    self.clock = clock
+    self.latency = latency
+    self.rate = rate
+    self.burst = burst
+    self.calls = Counter()
+    self.throttles = Counter()
+    self.limits = {}
+    self.lock = threading.Lock()
+
+  def request(self, operation):
+    with self.lock:
+      self.calls[operation] += 1
+      limit = self.limits.get(operation)
+      if limit is None:
+        limit = self.limits[operation] = Limit(self.clock, self.rate, self.burst)
+    if self.latency:
+      REAL_SLEEP(self.latency)
+    if self.rate and not limit.take():
+      with self.lock:
+        self.throttles[operation] += 1
+      raise client_error('ThrottlingException', operation, 'Rate exceeded')
+
+def utc(timestamp):
+  return datetime.utcfromtimestamp(timestamp) if timestamp is not None else None
+
+class FakeEcs(FakeService):
+  """Fake ECS service whose tasks start after 'pending_time' seconds and exit after running for 'run_time' seconds"""
+  def __init__(self, clock, pending_time=30, run_time=120, stop_time=5, instances=10, **kwargs):
+    super(FakeEcs, self).__init__(clock, **kwargs)
+    self.pending_time = pending_time
+    self.run_time = run_time
+    self.stop_time = stop_time
+    self.tasks = {}
+    self.task_ids = itertools.count(1)
+    self.instances = ['arn:aws:ecs:us-west-2:123456789012:container-instance/%s' % i for i in range(instances)]
+
+  def create_tasks(self, cluster, task_definition, overrides, count, started_by):
+    created = self.clock.time()
+    tasks = []
+    with self.lock:
+      for _ in range(count):
+        arn = 'arn:aws:ecs:us-west-2:123456789012:task/%08d-0000-0000-0000-000000000000' % next(self.task_ids)
+        self.tasks[arn] = {
+          'taskArn': arn, 'cluster': cluster, 'taskDefinition': task_definition, 'overrides': overrides,
+          'startedBy': started_by, 'created': created, 'stopped': None
+        }
+        tasks.append(arn)
+    return [self.describe(arn) for arn in tasks]
+
+  # Returns the full task description at the current simulated time
+  def describe(self, arn):
+    task = self.tasks[arn]
+    now = self.clock.time()
+    started = task['created'] + self.pending_time
+    stopped = min(started + self.run_time, task['stopped'] or float('inf'))
+    status = 'STOPPED' if now >= stopped else 'RUNNING' if now >= started else 'PENDING'
+    containers = [{
+      'containerArn': arn.replace(':task/', ':container/'),
+      'taskArn': arn,
+      'name': 'app',
+      'lastStatus': status,
+      'networkBindings': [],
+      'networkInterfaces': [],
+      'healthStatus': 'UNKNOWN',
+      'cpu': '0'
+    }]
+    if status == 'STOPPED':
+      containers[0]['exitCode'] = 0
+    return dict((k, v) for k, v in {
+      'taskArn': arn,
+      'clusterArn': 'arn:aws:ecs:us-west-2:123456789012:cluster/%s' % task['cluster'],
+      'taskDefinitionArn': self.task_definition_arn(task['taskDefinition']),
+      'containerInstanceArn': self.instances[0],
+      'overrides': dict({'containerOverrides': [], 'inferenceAcceleratorOverrides': []}, **task['overrides']),
+      'lastStatus': status,
+      'desiredStatus': 'STOPPED' if task['stopped'] or status == 'STOPPED' else 'RUNNING',
+      'cpu': '256',
+      'memory': '512',
+      'containers': containers,
+      'startedBy': task['startedBy'],
+      'version': {'PENDING': 1, 'RUNNING': 2, 'STOPPED': 3}[status],
+      'stoppedReason': 'Essential container in task exited' if status == 'STOPPED' else None,
+      'connectivity': 'CONNECTED',
+      'createdAt': utc(task['created']),
+      'startedAt': utc(started) if status != 'PENDING' else None,
+      'stoppedAt': utc(stopped) if status == 'STOPPED' else None,
+      'group': 'family:%s' % task['taskDefinition'].split('/')[-1].split(':')[0],
+      'launchType': 'EC2',
+      'attachments': [],
+      'healthStatus': 'UNKNOWN',
+      'tags': []
+    }.items() if v is not None)
+
+  def task_definition_arn(self, task_definition):
+    if task_definition.startswith('arn:'):
+      return task_definition
+    if not re.match(r'^.+:\d+$', task_definition):
+      task_definition += ':1'
+    return 'arn:aws:ecs:us-west-2:123456789012:task-definition/%s' % task_definition
+
+  def run_task(self, cluster, taskDefinition, overrides={}, count=1, startedBy=None):
+    self.request('RunTask')
+    if count > 10:
+      raise client_error('InvalidParameterException', 'RunTask', 'count must be between 1 and 10')
+    return {'tasks': self.create_tasks(cluster, taskDefinition, overrides, count, startedBy), 'failures': []}
+
+  def start_task(self, cluster, taskDefinition, containerInstances, overrides={}, startedBy=None):
+    self.request('StartTask')
+    return {'tasks': self.create_tasks(cluster, taskDefinition, overrides, len(containerInstances), startedBy), 'failures': []}
+
+  def describe_tasks(self, cluster, tasks):
+    self.request('DescribeTasks')
+    if len(tasks) > 100:
+      raise client_error('InvalidParameterException', 'DescribeTasks', 'tasks can have at most 100 items')
+    return {
+      'tasks': [self.describe(t) for t in tasks if t in self.tasks],
+      'failures': [{'arn': t, 'reason': 'MISSING'} for t in tasks if t not in self.tasks]
+    }
+
+  def list_tasks(self, cluster, startedBy=None, nextToken=None, **kwargs):
+    self.request('ListTasks')
+    # Pages continue after the last task listed, so tasks stopped while listing do not shift later pages
+    arns = sorted(arn for arn, t in self.tasks.items()
+      if t['cluster'] == cluster and startedBy in (None, t['startedBy']) and arn > (nextToken or '')
+      and self.describe(arn)['desiredStatus'] == 'RUNNING')
+    response = {'taskArns': arns[:LIST_PAGE_SIZE]}
+    if len(arns) > LIST_PAGE_SIZE:
+      response['nextToken'] = arns[LIST_PAGE_SIZE - 1]
+    return response
+
+  def stop_task(self, cluster, task, reason=None):
+    self.request('StopTask')
+    with self.lock:
+      self.tasks[task]['stopped'] = self.tasks[task]['stopped'] or self.clock.time() + self.stop_time
+    return {'task': self.describe(task)}
+
+  def describe_task_definition(self, taskDefinition):
+    self.request('DescribeTaskDefinition')
+    return {'taskDefinition': {
+      'taskDefinitionArn': self.task_definition_arn(taskDefinition),
+      'containerDefinitions': [{
+        'name': 'app',
+        'image': 'nginx:latest',
+        'environment': [{'name': 'VERSION', 'value': self.task_definition_arn(taskDefinition).split(':')[-1]}]
+      }],
+      'status': 'ACTIVE'
+    }}
+
+  def list_container_instances(self, cluster, nextToken=None):
+    self.request('ListContainerInstances')
+    start = int(nextToken or 0)
+    response = {'containerInstanceArns': self.instances[start:start + LIST_PAGE_SIZE]}
+    if start + LIST_PAGE_SIZE < len(self.instances):
+      response['nextToken'] = str(start + LIST_PAGE_SIZE)
+    return response
+
+  def describe_container_instances(self, cluster, containerInstances):
+    self.request('DescribeContainerInstances')
+    return {'containerInstances': [
+      {'containerInstanceArn': a, 'ec2InstanceId': 'i-%08d' % self.instances.index(a)} for a in containerInstances
+    ]}
+
+class FakeCloudFormation(FakeService):
+  """Fake CloudFormation service that describes every stack with the given status"""
+  def __init__(self, clock, stack_status='UPDATE_IN_PROGRESS', **kwargs):
+    super(FakeCloudFormation, self).__init__(clock, **kwargs)
+    self.stack_status = stack_status
+
+  def describe_stacks(self, StackName, NextToken=None):
+    self.request('DescribeStacks')
+    return {'Stacks': [{
+      'StackId': StackName,
+      'StackName': StackName.split('/')[-2] if '/' in StackName else StackName,
+      'StackStatus': self.stack_status,
+      'CreationTime': utc(self.clock.time()),
+      'Parameters': [{'ParameterKey': 'Param%d' % i, 'ParameterValue': 'value'} for i in range(20)],
+      'Outputs': [{'OutputKey': 'Output%d' % i, 'OutputValue': 'value'} for i in range(20)],
+      'Tags': [{'Key': 'Tag%d' % i, 'Value': 'value'} for i in range(10)]
+    }]}
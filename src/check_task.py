@@ -1,14 +1,17 @@
-import datetime
+import time
 import logging
 import sys, os
 parent_dir = os.path.abspath(os.path.dirname(__file__))
 vendor_dir = os.path.join(parent_dir, 'vendor')
 sys.path.append(vendor_dir)
 
-from dateutil.parser import parse
 from lib import EcsTaskManager, EcsTaskFailureError, EcsTaskExitCodeError, EcsTaskTimeoutError
 from lib import validate_ecs
 from lib import ecs_error_handler
+from lib import lazy_json
+from lib import TaskTracker
+from lib import to_timestamp
+from lib import check_launch, finish_launch, QUEUED
 
 # Configure logging
 logging.basicConfig()
@@ -20,32 +23,49 @@ task_mgr = EcsTaskManager()
 
 # Checks if timeout has exceeded
 def check_timeout(event):
-  now = parse(datetime.datetime.utcnow().isoformat() + 'Z')
-  creation = parse(event['CreateTimestamp'])
-  if now > creation + datetime.timedelta(seconds=event['Timeout']):
-    raise EcsTaskTimeoutError(event['Tasks'], creation, event['Timeout'])
+  if time.time() > to_timestamp(event['CreateTimestamp']) + event['Timeout']:
+    raise EcsTaskTimeoutError(event['Tasks'], event['CreateTimestamp'], event['Timeout'])
 
 # Checks ECS task exit codes
 def check_exit_codes(tasks):
-  non_zero = [c.get('taskArn') for t in tasks for c in t.get('containers') if c.get('exitCode') != 0]
+  non_zero = [t.get('taskArn') for t in tasks for c in t.get('containers') if c.get('exitCode') != 0]
   if non_zero:
     raise EcsTaskExitCodeError(tasks, non_zero)
 
+# Starts the tasks of a queued launch once the cluster has capacity
+def check_queued(event):
+  result = check_launch(task_mgr, event['Cluster'], event['LaunchId'])
+  if result is not None:
+    event['Tasks'] = result['tasks']
+    event['Failures'] = result['failures']
+    event['Status'] = task_mgr.check_status(event['Tasks'])
+  return event
+
 @ecs_error_handler
 def handler(event, context):
-  log.info('Received event %s' % str(event))
+  log.info('Received event %s', lazy_json(event))
   # Validate event and create task
   event = validate_ecs(event)
-  check_timeout(event)
-  # Query task status
-  task_arns = [t.get('taskArn') for t in event['Tasks']]
-  result = task_mgr.describe_tasks(cluster=event['Cluster'], tasks=task_arns)
-  event['Tasks'] = result['tasks']
-  event['Failures'] = result['failures']
-  if event['Failures']:
-    raise EcsTaskFailureError(result)
-  # Check if task is complete
-  event['Status'] = task_mgr.check_status(event['Tasks'])
-  if event['Status'] == 'STOPPED':
-    check_exit_codes(event['Tasks'])
+  if event['Status'] == QUEUED:
+    check_timeout(event)
+    return check_queued(event)
+  # Queued launches release their slot once their tasks have stopped or failed
+  finished = True
+  try:
+    check_timeout(event)
+    # Query status of tasks that have not yet stopped
+    tracker = TaskTracker(event['Tasks'], detail=event['Detail'], fail_fast=event['FailFast'])
+    result = tracker.refresh(task_mgr, event['Cluster'])
+    event['Tasks'] = tracker.result()['tasks']
+    event['Failures'] = tracker.failures
+    if event['Failures']:
+      raise EcsTaskFailureError(result)
+    # Check if task is complete
+    event['Status'] = tracker.status
+    finished = event['Status'] == 'STOPPED'
+    if finished:
+      check_exit_codes(event['Tasks'])
+  finally:
+    if finished:
+      finish_launch(event.get('LaunchId'))
   return event
\ No newline at end of file
@@ -0,0 +1,35 @@
+import logging
+import sys, os
+parent_dir = os.path.abspath(os.path.dirname(__file__))
+vendor_dir = os.path.join(parent_dir, 'vendor')
+sys.path.append(vendor_dir)
+
+import check_task
+from lib import validate_batch
+from lib import ecs_error_handler
+from lib import concurrent_map
+
+# Configure logging
+logging.basicConfig()
+log = logging.getLogger()
+log.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+# Task spec statuses that are not checked again
+FINISHED_STATES = ['STOPPED', 'FAILED']
+
+# Checks a task spec unless it has already finished
+def check(spec, context):
+  if spec.get('Status') in FINISHED_STATES:
+    return spec
+  return check_task.handler(spec, context)
+
+# Checks each unfinished task spec concurrently, recording the status (and any failure reason) per spec
+@ecs_error_handler
+def handler(event, context):
+  log.info('Received batch of %s task specs', len(event.get('Specs') or []))
+  event = validate_batch(event)
+  event['Specs'] = concurrent_map(lambda spec: check(spec, context), event['Specs'])
+  event['Status'] = check_task.task_mgr.check_batch_status(event['Specs'])
+  if event['Status'] == 'FAILED':
+    event['Reason'] = 'One or more task specs failed: %s' % [i for i, s in enumerate(event['Specs']) if s['Status'] == 'FAILED']
+  return event
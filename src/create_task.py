@@ -8,6 +8,9 @@ from datetime import datetime
 from lib import EcsTaskManager, EcsTaskFailureError
 from lib import validate_ecs
 from lib import ecs_error_handler
+from lib import lazy_json
+from lib import snapshot_tasks
+from lib import enqueue, check_launch, to_timestamp, QUEUED
 
 # Configure logging
 logging.basicConfig()
@@ -19,10 +22,34 @@ task_mgr = EcsTaskManager()
 
 @ecs_error_handler
 def handler(event, context):
-  log.info('Received event %s' % str(event))
+  log.info('Received event %s', lazy_json(event))
   # Validate event
   event = validate_ecs(event)
   event['CreateTimestamp'] = datetime.utcnow().isoformat() + 'Z'
+  # Reject tasks that the cluster cannot place rather than launching them
+  if event['Preflight'] == 'Reject':
+    event['Failures'], _ = task_mgr.check_capacity(
+      cluster=event['Cluster'],
+      task_definition=event['TaskDefinition'],
+      overrides=event['Overrides'],
+      count=event['Count'],
+      instances=event['Instances']
+    )
+    if event['Failures']:
+      raise EcsTaskFailureError({'tasks': [], 'failures': event['Failures']})
+  # Queue the launch until the cluster has capacity
+  if event['Preflight'] == 'Wait':
+    expires = to_timestamp(event['CreateTimestamp']) + event['Timeout']
+    event['LaunchId'] = enqueue(event, event['Priority'], expires)
+    result = check_launch(task_mgr, event['Cluster'], event['LaunchId'])
+    if result is None:
+      event['Tasks'], event['Failures'] = [], []
+      event['Status'] = QUEUED
+      return event
+    event['Tasks'] = result['tasks']
+    event['Failures'] = result['failures']
+    event['Status'] = task_mgr.check_status(event['Tasks'])
+    return event
   # Start task
   result = task_mgr.start_task(
     cluster=event['Cluster'],
@@ -32,7 +59,7 @@ def handler(event, context):
     instances=event['Instances'],
     started_by=event['StartedBy']
   )
-  event['Tasks'] = result['tasks']
+  event['Tasks'] = snapshot_tasks(result['tasks'], event['Detail'])
   event['Failures'] = result['failures']
   if event['Failures']:
     raise EcsTaskFailureError(result)
@@ -5,18 +5,29 @@ sys.path.append(vendor_dir)
 
 import time
 import logging
-import json
-from datetime import datetime
 from cfn_lambda_handler import Handler, CfnLambdaExecutionTimeout
-from hashlib import md5
 from lib import CfnManager
 from lib import EcsTaskManager, EcsTaskFailureError, EcsTaskExitCodeError, EcsTaskTimeoutError
 from lib import validate_cfn
 from lib import cfn_error_handler
+from lib import get_event_queue, wait_for_stopped
+from lib import PollScheduler, record_timings, SAFETY_MARGIN
+from lib import batches
+from lib import submit, gather, settle
+from lib import lazy_json, task_summary
+from lib import snapshot_result
+from lib import TaskTracker
+from lib import timed, sleep
+from lib import save_checkpoint, load_checkpoint, update_budget
+from lib import task_id, is_task_arn, task_data
+from lib import enqueue, check_launch, finish_launch
 
 # Stack rollback states
 ROLLBACK_STATES = ['ROLLBACK_IN_PROGRESS','UPDATE_ROLLBACK_IN_PROGRESS']
 
+# Number of tasks stopped concurrently on delete, matching the ListTasks page size
+STOP_BATCH_SIZE = 100
+
 # Set handler as the entry point for Lambda
 handler = Handler()
 
@@ -40,19 +51,72 @@ def start(task):
     started_by=task['StartedBy']
   )
 
-# Outputs JSON
-def format_json(data):
-  return json.dumps(data, default=lambda d: d.isoformat() if isinstance(d, datetime) else str(d))
+# Rejects tasks that the cluster cannot place before starting them, if the Preflight property is 'Reject'
+@timed('preflight')
+def preflight(task):
+  if task['Preflight'] != 'Reject':
+    return
+  failures, _ = task_mgr.check_capacity(
+    cluster=task['Cluster'],
+    task_definition=task['TaskDefinition'],
+    overrides=task['Overrides'],
+    count=task['Count'],
+    instances=task['Instances']
+  )
+  if failures:
+    raise EcsTaskFailureError({'tasks': [], 'failures': failures})
+
+# Waits for a queued launch to start, dispatching queued launches every poll interval
+# A checkpoint is saved for the poll handler to resume from if the Lambda execution time runs out first
+@timed('await_launch')
+def await_launch(task, remaining_time):
+  while True:
+    if task['CreationTime'] + task['Timeout'] < int(time.time()):
+      raise EcsTaskTimeoutError([], task['CreationTime'], task['Timeout'])
+    result = check_launch(task_mgr, task['Cluster'], task['LaunchId'])
+    if result is not None:
+      del task['Queued']
+      return result
+    interval = task['PollInterval']
+    if (interval + SAFETY_MARGIN) * 1000 > remaining_time():
+      task['TaskResult'] = {'tasks': [], 'failures': []}
+      raise CfnLambdaExecutionTimeout(save_checkpoint(task))
+    log.info("Insufficient capacity to start task(s), launch %s is queued, checking again in %d seconds...", task['LaunchId'], interval)
+    sleep(interval)
+
+# Starts the tasks, queueing the launch until the cluster has capacity if the Preflight property is 'Wait'
+def launch(task, remaining_time):
+  if task['Preflight'] != 'Wait':
+    preflight(task)
+    return start(task)
+  task['LaunchId'] = enqueue(task, task['Priority'], task['CreationTime'] + task['Timeout'])
+  task['Queued'] = True
+  return await_launch(task, remaining_time)
+
+# Polls the tasks, releasing their launch slot (if they were queued) once they have completed or failed
+def poll_launched(task, remaining_time, detail=None):
+  finished = True
+  try:
+    poll(task, remaining_time, detail)
+  except CfnLambdaExecutionTimeout:
+    finished = False
+    raise
+  finally:
+    if finished:
+      finish_launch(task.get('LaunchId'))
 
 # Transforms a list of dicts into a keyed dictionary
 def to_dict(items, key, value):
   return dict(zip([i[key] for i in items], [i[value] for i in items]))
 
-# Creates a fixed length consist ID based from a given stack ID and resource IC
+# Creates a fixed length consistent ID based from a given stack ID and resource ID
 def get_task_id(stack_id, resource_id):
-  m = md5()
-  m.update(stack_id + resource_id)
-  return m.hexdigest()
+  return task_id(stack_id, resource_id)
+
+# Returns the physical resource ID (the first task ARN) and response data listing the ARNs of the launched tasks
+def resource_response(task_result):
+  task_arns = [t['taskArn'] for t in task_result['tasks']]
+  return {'PhysicalResourceId': task_arns[0], 'Data': task_data(task_arns)}
 
 # Gets ECS task definition and returns environment variable values for a given set of update criteria
 def get_task_definition_values(task_definition_arn, update_criteria):
@@ -60,51 +124,61 @@ def get_task_definition_values(task_definition_arn, update_criteria):
   containers = to_dict(task_definition['containerDefinitions'],'name','environment')
   return [env['value'] for u in update_criteria for env in containers.get(u['Container'],{}) if env['name'] in u['EnvironmentKeys']]
 
-# Updates ECS task status
-def describe_tasks(cluster, task_result):
-  tasks = task_result['tasks']
-  task_arns = [t.get('taskArn') for t in tasks]
-  return task_mgr.describe_tasks(cluster=cluster, tasks=task_arns)
-
-# Checks ECS task completion
-def check_complete(task_result):
-  if task_result.get('failures'):
-    raise EcsTaskFailureError(task_result)
-  tasks = task_result.get('tasks')
-  return all(t.get('lastStatus') == 'STOPPED' for t in tasks)
-
 # Checks ECS task exit codes
 def check_exit_codes(task_result):
   tasks = task_result['tasks']
-  non_zero = [c.get('taskArn') for t in tasks for c in t.get('containers') if c.get('exitCode') != 0]
+  non_zero = [t.get('taskArn') for t in tasks for c in t.get('containers') if c.get('exitCode') != 0]
   if non_zero:
     raise EcsTaskExitCodeError(tasks, non_zero)
 
-# Polls an ECS task for completion 
-def poll(task, remaining_time):
-  poll_interval = task.get('PollInterval') or 10
+# Waits up to the poll interval, returning early once task state change events report all tasks as stopped
+@timed('wait')
+def wait(task, pending, poll_interval):
+  if task.get('EventQueue'):
+    wait_for_stopped(get_event_queue(task['EventQueue']), pending, poll_interval)
+  else:
+    sleep(poll_interval)
+
+# Polls an ECS task for completion, backing off between checks until the Lambda execution time is exhausted
+# The latest full task result (if available) is used to schedule checks, while the task state holds a snapshot
+# A checkpoint including the time of the next check is saved for the poll handler to resume from
+@timed('poll')
+def poll(task, remaining_time, detail=None):
+  scheduler = PollScheduler(task.get('PollInterval') or 10, task.get('PollAttempt', 0))
+  task_result = task['TaskResult']
+  tracker = TaskTracker(task_result['tasks'], task_result.get('failures'), task.get('Detail'), task.get('FailFast'))
+  detail = detail or task['TaskResult']
   while True:
-    task_result = task['TaskResult']
     if task['CreationTime'] + task['Timeout'] < int(time.time()):
       raise EcsTaskTimeoutError(task['TaskResult']['tasks'], task['CreationTime'], task['Timeout'])
-    if remaining_time() < (poll_interval + 5) * 1000:
-      raise CfnLambdaExecutionTimeout(task)
-    if not check_complete(task_result):
-      log.info("Task(s) have not yet completed, checking again in %s seconds..." % poll_interval)
-      time.sleep(poll_interval)
-      task['TaskResult'] = describe_tasks(task['Cluster'], task_result)
-    else:
+    if tracker.failures:
+      raise EcsTaskFailureError(tracker.result())
+    if not tracker.unfinished:
       check_exit_codes(task['TaskResult'])
       return
+    next_check = task.pop('NextCheck', None)
+    if next_check is None:
+      next_check = time.time() + scheduler.next_interval(detail, time.time())
+    task['PollAttempt'] = scheduler.attempt
+    interval = scheduler.fit(max(next_check - time.time(), 0), remaining_time())
+    if interval is None:
+      task['NextCheck'] = next_check
+      raise CfnLambdaExecutionTimeout(save_checkpoint(task))
+    log.info("Task(s) have not yet completed, checking again in %.1f seconds...", interval)
+    wait(task, tracker.unfinished, interval)
+    detail = tracker.refresh(task_mgr, task['Cluster'])
+    record_timings(detail)
+    task['TaskResult'] = tracker.result()
 
 # Start and poll task
 def start_and_poll(task, context):
-  task['TaskResult'] = start(task)
-  log.info("Task created successfully with result: %s" % format_json(task['TaskResult']))
+  result = launch(task, context.get_remaining_time_in_millis)
+  log.info("Task created successfully with result: %s", task_summary(result))
+  task['TaskResult'] = snapshot_result(result, task.get('Detail'))
   if task['Timeout'] > 0:
-    poll(task,context.get_remaining_time_in_millis)
-    log.info("Task completed successfully with result: %s" % format_json(task['TaskResult']))
-  return next(t['taskArn'] for t in task['TaskResult']['tasks'])
+    poll_launched(task, context.get_remaining_time_in_millis, result)
+    log.info("Task completed successfully with result: %s", task_summary(task['TaskResult']))
+  return resource_response(task['TaskResult'])
 
 # Create task
 def create_task(event):
@@ -112,58 +186,90 @@ def create_task(event):
   task['StartedBy'] = get_task_id(event['StackId'],event['LogicalResourceId'])
   event['Timeout'] = task['Timeout']
   task['CreationTime'] = event['CreationTime']
-  log.info('Received task %s' % format_json(task))
+  log.info('Received task %s', lazy_json(task))
   return task
 
 # Event handlers
 @handler.poll
 @cfn_error_handler
 def handle_poll(event, context):
-  log.info('Received poll event %s' % str(event))
-  task = event.get('EventState')
-  poll(task, context.get_remaining_time_in_millis)
-  log.info("Task completed with result: %s" % task['TaskResult'])
-  return {
-    "Status": "SUCCESS", 
-    "PhysicalResourceId": next(t['taskArn'] for t in task['TaskResult']['tasks'])
-  }
+  log.info('Received poll event %s', lazy_json(event))
+  task = load_checkpoint(event.get('EventState'))
+  if task.get('Queued'):
+    task['TaskResult'] = await_launch(task, context.get_remaining_time_in_millis)
+  poll_launched(task, context.get_remaining_time_in_millis)
+  log.info("Task completed with result: %s", task_summary(task['TaskResult']))
+  log.info("Task polling used %(Invocations)d invocation(s) and %(ApiCalls)d API request(s)", update_budget(task.get('Budget', {})))
+  return dict(resource_response(task['TaskResult']), Status="SUCCESS")
 
 @handler.create
 @cfn_error_handler
 def handle_create(event, context):
-  log.info('Received create event %s' % str(event))
+  log.info('Received create event %s', lazy_json(event))
   task = create_task(event)
   if task['Count'] > 0:
-    event['PhysicalResourceId'] = start_and_poll(task, context)
+    event.update(start_and_poll(task, context))
   return event
 
+# Returns the stack status provided with the event, only describing the stack when it is unknown
+def get_stack_status(event):
+  stack_status = event.get('StackStatus')
+  if stack_status in [None, 'UNKNOWN']:
+    stack_status = cfn_mgr.get_stack_status(event['StackId'])
+  return stack_status
+
 @handler.update
 @cfn_error_handler
 def handle_update(event, context):
-  log.info('Received update event %s' % str(event))
+  log.info('Received update event %s', lazy_json(event))
   task = create_task(event)
   update_criteria = task['UpdateCriteria']
   should_run = task['RunOnUpdate'] and task['Count'] > 0
   if should_run:
     old_task = validate_cfn(event.get('OldResourceProperties'))
-    if not task['RunOnRollback']:
-      stack_status = cfn_mgr.get_stack_status(event['StackId'])
-      should_run = stack_status not in ROLLBACK_STATES
-    if update_criteria and should_run:
-      old_values = get_task_definition_values(old_task['TaskDefinition'],update_criteria)
-      new_values = get_task_definition_values(task['TaskDefinition'],update_criteria)
+    # The stack status and both task definitions are looked up concurrently, as none depends on another
+    stack_status = submit(get_stack_status, event) if not task['RunOnRollback'] else None
+    if update_criteria and old_task['TaskDefinition'] != task['TaskDefinition']:
+      lookups = [submit(get_task_definition_values, arn, update_criteria) for arn in [old_task['TaskDefinition'],task['TaskDefinition']]]
+    else:
+      lookups = []
+    if stack_status:
+      should_run = stack_status.result() not in ROLLBACK_STATES
+    if not should_run:
+      # Lookups are still waited for, so that no request outlives the invocation
+      settle(lookups)
+    elif update_criteria:
+      old_values, new_values = gather(lookups) if lookups else (None, None)
       if old_values != new_values:
-        event['PhysicalResourceId'] = start_and_poll(task, context)
-    elif should_run:
-      event['PhysicalResourceId'] = start_and_poll(task, context)
+        event.update(start_and_poll(task, context))
+    else:
+      event.update(start_and_poll(task, context))
   return event
   
+# Returns the tasks launched for a resource that may still be running
+# A single task is identified by the physical resource ID, otherwise tasks are listed by their started by ID
+# When Instances is set one task is launched per instance, regardless of Count
+def get_launched_tasks(task, physical_resource_id):
+  if is_task_arn(physical_resource_id) and task['Count'] == 1 and not task['Instances']:
+    described = task_mgr.describe_tasks(cluster=task['Cluster'], tasks=[physical_resource_id])
+    return [t['taskArn'] for t in described['tasks'] if t.get('lastStatus') != 'STOPPED']
+  return task_mgr.iter_tasks(cluster=task['Cluster'], startedBy=task['StartedBy'])
+
 @handler.delete
 @cfn_error_handler
 def handle_delete(event, context):
-  log.info('Received delete event %s' % str(event))
+  log.info('Received delete event %s', lazy_json(event))
   task = create_task(event)
-  tasks = task_mgr.list_tasks(cluster=task['Cluster'], startedBy=task['StartedBy'])
-  for t in tasks:
-    task_mgr.stop_task(cluster=task['Cluster'], task=t, reason='Delete requested for %s' % event['StackId'])
+  reason = 'Delete requested for %s' % event['StackId']
+  tasks = get_launched_tasks(task, event.get('PhysicalResourceId'))
+  # Each batch of tasks is stopped while the next batch is listed
+  stopping = [
+    task_mgr.stop_tasks_async(cluster=task['Cluster'], tasks=batch, reason=reason)
+    for batch in batches(tasks, STOP_BATCH_SIZE)
+  ]
+  errors = [r for results in gather(stopping) for r in results if 'error' in r]
+  for e in errors:
+    log.error("Failed to stop task %s: %s", e['taskArn'], e['error'])
+  if errors:
+    raise errors[0]['error']
   return event
\ No newline at end of file
@@ -1,4 +1,17 @@
 from .cfn import CfnManager
 from .ecs import EcsTaskManager, EcsTaskFailureError, EcsTaskExitCodeError, EcsTaskTimeoutError
-from .validation import validate_ecs, validate_cfn
-from .errors import ecs_error_handler, cfn_error_handler
\ No newline at end of file
+from .validation import validate_ecs, validate_cfn, validate_batch
+from .errors import ecs_error_handler, cfn_error_handler
+from .events import get_event_queue, wait_for_stopped
+from .scheduler import PollScheduler, record_timings, SAFETY_MARGIN
+from .utils import concurrent_map, batches, to_timestamp
+from .formatting import format_json, lazy_json, task_summary
+from .clients import get_client, get_pool_stats
+from .throttle import ThrottledClient
+from .metrics import timed, sleep, MemorySink, set_sink
+from .snapshot import snapshot_tasks, snapshot_result
+from .tracker import TaskTracker
+from .checkpoint import save_checkpoint, load_checkpoint, update_budget
+from .identity import task_id, is_task_arn, task_data
+from .executor import submit, gather, settle, Asynchronous
+from .launches import enqueue, dispatch, check_launch, finish_launch, set_launch_store, SqliteLaunchStore, QUEUED
\ No newline at end of file
@@ -0,0 +1,41 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+  """Thread safe least recently used cache whose entries expire after a time to live"""
+  def __init__(self, maxsize=128, ttl=300):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key, default=None):
+    with self.lock:
+      entry = self.entries.pop(key, None)
+      if entry is None or entry[1] < time.time():
+        return default
+      self.entries[key] = entry
+      return entry[0]
+
+  def set(self, key, value, ttl=None):
+    with self.lock:
+      self.entries.pop(key, None)
+      self.entries[key] = (value, time.time() + (self.ttl if ttl is None else ttl))
+      while len(self.entries) > self.maxsize:
+        self.entries.popitem(last=False)
+
+  def get_or_load(self, key, loader, ttl=None):
+    value = self.get(key)
+    if value is None:
+      value = loader()
+      self.set(key, value, ttl)
+    return value
+
+  def delete(self, key):
+    with self.lock:
+      self.entries.pop(key, None)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
@@ -0,0 +1,67 @@
+# Resources compared by the capacity preflight, as named in container instance resources and placement failures
+RESOURCES = ['CPU', 'MEMORY']
+
+def to_int(value):
+  try:
+    return int(value or 0)
+  except (TypeError, ValueError):
+    return 0
+
+def task_requirements(task_definition, overrides=None):
+  '''
+  Returns the (cpu, memory) reserved by one task of the task definition, after applying task and container overrides.
+  Task level cpu and memory take precedence, otherwise the container reservations are added up.
+  '''
+  overrides = overrides or {}
+  container_overrides = dict((o.get('name'), o) for o in overrides.get('containerOverrides', []))
+  cpu = memory = 0
+  for c in task_definition.get('containerDefinitions', []):
+    c = dict(c, **container_overrides.get(c.get('name'), {}))
+    cpu += to_int(c.get('cpu'))
+    memory += to_int(c.get('memory') or c.get('memoryReservation'))
+  cpu = to_int(overrides.get('cpu') or task_definition.get('cpu')) or cpu
+  memory = to_int(overrides.get('memory') or task_definition.get('memory')) or memory
+  return cpu, memory
+
+def resources(items):
+  values = dict((r.get('name'), r.get('integerValue', 0)) for r in items or [])
+  return tuple(values.get(name, 0) for name in RESOURCES)
+
+def instance_capacity(instance):
+  '''
+  Returns the container instance ARN with its registered and remaining (cpu, memory).
+  '''
+  return {
+    'containerInstanceArn': instance['containerInstanceArn'],
+    'registered': resources(instance.get('registeredResources')),
+    'remaining': resources(instance.get('remainingResources'))
+  }
+
+def can_place(available, required):
+  return all(a >= r for a, r in zip(available, required))
+
+def placeable(available, required):
+  '''
+  Returns the number of tasks requiring 'required' (cpu, memory) that fit in 'available' (cpu, memory).
+  '''
+  counts = [a // r for a, r in zip(available, required) if r > 0]
+  return min(counts) if counts else float('inf')
+
+def shortfall(capacity, required, count):
+  '''
+  Returns the placement failures of 'count' tasks requiring 'required' (cpu, memory) on the given instances,
+  in the form of RunTask failures, and whether the tasks could be placed once running tasks release resources.
+  Tasks that do not fit in the registered resources of any instance will never be placed.
+  '''
+  if not any(can_place(c['registered'], required) for c in capacity):
+    return [{
+      'reason': 'RESOURCE:%s' % ','.join(RESOURCES),
+      'detail': 'No container instance has %d CPU units and %d MiB of memory registered' % required
+    }], False
+  if sum(placeable(c['remaining'], required) for c in capacity) >= count:
+    return [], True
+  short = [name for i, name in enumerate(RESOURCES) if sum(placeable(c['remaining'][i:i+1], required[i:i+1]) for c in capacity) < count]
+  return [{
+    'reason': 'RESOURCE:%s' % ','.join(short or RESOURCES),
+    'detail': 'Remaining cluster resources cannot place %d task(s) of %d CPU units and %d MiB of memory' % ((count,) + required)
+  }], True
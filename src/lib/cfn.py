@@ -1,16 +1,48 @@
+import os
 from functools import partial
+from .cache import TTLCache
 from .utils import paginated_response
-import boto3
+from .clients import get_client
+from .throttle import ThrottledClient
+from .executor import Asynchronous
+from .metrics import timed
 
-class CfnManager:
+# Stack statuses per stack, shared across warm invocations for a few seconds as nested stacks often check the same stack
+STACK_STATUS_CACHE = TTLCache(
+  maxsize=64,
+  ttl=int(os.environ.get('STACK_STATUS_CACHE_TTL', 5))
+)
+
+class CfnManager(Asynchronous):
   """Handles CloudFormation Service Requests""" 
-  def __init__(self):
-    self.client = boto3.client('cloudformation')
+  def __init__(self, client=None):
+    self._client = client
+
+  @property
+  def client(self):
+    if self._client is None:
+      self._client = get_client('cloudformation')
+    return self._client
+
+  @client.setter
+  def client(self, client):
+    self._client = client
+
+  # Rate limited client that retries throttled requests, used for all CloudFormation API calls
+  @property
+  def api(self):
+    return ThrottledClient(self.client, 'cloudformation')
 
-  def describe_stacks(self, stack_name):
-    func = partial(self.client.describe_stacks,StackName=stack_name)
-    return paginated_response(func, 'Stacks')
+  @timed('cloudformation.describe_stacks')
+  def describe_stacks(self, stack_name, max_items=None):
+    func = partial(self.api.describe_stacks,StackName=stack_name)
+    return paginated_response(func, 'Stacks', max_items)
 
+  @timed('cloudformation.get_stack_status')
   def get_stack_status(self, stack_name):
-    # return self.describe_stacks(stack_name)
-    return next(s for s in self.describe_stacks(stack_name))['StackStatus']
\ No newline at end of file
+    '''
+    Returns the status of a stack using a single DescribeStacks request, without following further pages.
+    Statuses are cached for STACK_STATUS_CACHE_TTL seconds.
+    '''
+    load = lambda: self.api.describe_stacks(StackName=stack_name)['Stacks'][0]['StackStatus']
+    return STACK_STATUS_CACHE.get_or_load(stack_name, load)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import os
+from .formatting import json_native
+from .snapshot import select
+from .throttle import get_stats
+
+# Version of the checkpoint format written by save_checkpoint
+CHECKPOINT_VERSION = 1
+
+# Task properties needed to resume polling
+RESUME_FIELDS = ['Cluster', 'Timeout', 'CreationTime', 'PollInterval', 'EventQueue', 'Detail', 'FailFast', 'LaunchId', 'Queued']
+
+# Poll schedule state carried between invocations
+POLL_FIELDS = ['PollAttempt', 'NextCheck']
+
+# Task fields kept for stopped tasks only, as they are needed to check exit codes once all tasks stop
+STOPPED_FIELDS = ['stoppedReason', 'containers']
+
+def update_budget(budget):
+  '''
+  Adds the current invocation and the AWS API requests it made to the budget accumulated by earlier invocations.
+  '''
+  calls = sum(s['calls'] for s in get_stats().values())
+  return {'Invocations': budget.get('Invocations', 0) + 1, 'ApiCalls': budget.get('ApiCalls', 0) + calls}
+
+def save_checkpoint(task):
+  '''
+  Returns a compact, JSON native checkpoint of a polling task for resuming in a new invocation.
+  Task ARNs are stored in order without their common prefix, alongside their last seen status.
+  Only stopped tasks keep their stopped reason and container exit codes, unless 'Detail' is set
+  in which case the full task descriptions are kept.
+  '''
+  tasks = task['TaskResult']['tasks']
+  checkpoint = {
+    'Version': CHECKPOINT_VERSION,
+    'Task': select(task, RESUME_FIELDS),
+    'Poll': select(task, POLL_FIELDS),
+    'Budget': update_budget(task.get('Budget', {})),
+    'Failures': json_native(task['TaskResult'].get('failures', []))
+  }
+  if task.get('Detail'):
+    checkpoint['Detail'] = json_native(tasks)
+    return checkpoint
+  arns = [t['taskArn'] for t in tasks]
+  prefix = os.path.commonprefix(arns) if len(arns) > 1 else ''
+  prefix = prefix[:prefix.rfind('/') + 1]
+  checkpoint['Tasks'] = {
+    'Prefix': prefix,
+    'Ids': [arn[len(prefix):] for arn in arns],
+    'Statuses': [t.get('lastStatus') for t in tasks],
+    'Stopped': dict(
+      (arn[len(prefix):], select(t, STOPPED_FIELDS)) for arn, t in zip(arns, tasks) if t.get('lastStatus') == 'STOPPED'
+    )
+  }
+  return checkpoint
+
+def load_checkpoint(state):
+  '''
+  Returns the polling task saved in a checkpoint.
+  Poll state saved before checkpoints were versioned holds the polling task itself and is returned as is.
+  '''
+  version = state.get('Version')
+  if version is None:
+    return state
+  if version != CHECKPOINT_VERSION:
+    raise ValueError('Unsupported checkpoint version %s' % version)
+  if 'Detail' in state:
+    tasks = state['Detail']
+  else:
+    saved = state['Tasks']
+    tasks = [
+      dict({'containers': []}, taskArn=saved['Prefix'] + i, lastStatus=s, **saved['Stopped'].get(i, {}))
+      for i, s in zip(saved['Ids'], saved['Statuses'])
+    ]
+  task = dict(state['Task'], TaskResult={'tasks': tasks, 'failures': state['Failures']}, Budget=state['Budget'])
+  task.update(state['Poll'])
+  return task
@@ -0,0 +1,101 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+from .metrics import increment
+
+# Maximum number of pooled HTTP connections per client, above the number of threads that share a client
+MAX_POOL_CONNECTIONS = int(os.environ.get('CLIENT_MAX_POOL_CONNECTIONS', 50))
+
+# Seconds to wait for a connection to be established and for a response to be read
+CONNECT_TIMEOUT = float(os.environ.get('CLIENT_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('CLIENT_READ_TIMEOUT', 30))
+
+# Enables TCP keep-alive on pooled connections, if supported by the installed botocore version
+TCP_KEEPALIVE = os.environ.get('CLIENT_TCP_KEEPALIVE', 'true').lower() in ['true', 'yes']
+
+# Retry mode applied by ThrottledClient: 'legacy' retries throttled requests only, while 'standard' and 'adaptive'
+# also retry transient errors.  Requests are always rate limited adaptively by ThrottledClient.
+RETRY_MODE = os.environ.get('CLIENT_RETRY_MODE', 'standard')
+
+def client_config():
+  '''
+  Returns the configuration of shared clients.
+  Requests are attempted once by botocore, as retries are made by ThrottledClient so that they are rate limited,
+  counted and bounded by the remaining Lambda execution time.
+  '''
+  options = dict(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT,
+    retries={'mode': 'standard', 'total_max_attempts': 1}
+  )
+  if 'tcp_keepalive' in Config.OPTION_DEFAULTS:
+    options['tcp_keepalive'] = TCP_KEEPALIVE
+  return Config(**options)
+
+CLIENT_CONFIG = client_config()
+
+# Session and clients shared by all managers in the process, created on first use
+SESSION = [None]
+CLIENTS = {}
+LOCK = threading.Lock()
+
+# In flight requests, peak in flight requests and requests made while the connection pool was full per service
+POOL_STATS = {}
+POOL_LOCK = threading.Lock()
+
+def get_session():
+  session = SESSION[0]
+  if session is None:
+    with LOCK:
+      session = SESSION[0]
+      if session is None:
+        session = SESSION[0] = boto3.session.Session()
+  return session
+
+# Returns the shared boto3 client for a service, creating it on first use
+def get_client(service):
+  client = CLIENTS.get(service)
+  if client is None:
+    session = get_session()
+    with LOCK:
+      client = CLIENTS.get(service)
+      if client is None:
+        client = CLIENTS[service] = session.client(service, config=CLIENT_CONFIG)
+        track_pool(client, service)
+  return client
+
+def track_pool(client, service):
+  '''
+  Counts the in flight requests of a client, recording requests that are sent while all pooled connections are in use.
+  Such requests open a connection that is discarded afterwards, so a high count means the pool should be larger.
+  '''
+  def sent(**kwargs):
+    with POOL_LOCK:
+      stats = POOL_STATS.setdefault(service, {'in_flight': 0, 'peak': 0, 'saturated': 0})
+      stats['in_flight'] += 1
+      stats['peak'] = max(stats['peak'], stats['in_flight'])
+      saturated = stats['in_flight'] > MAX_POOL_CONNECTIONS
+      if saturated:
+        stats['saturated'] += 1
+    if saturated:
+      increment('pool.%s.Saturated' % service)
+  def completed(**kwargs):
+    with POOL_LOCK:
+      POOL_STATS[service]['in_flight'] -= 1
+  client.meta.events.register('before-send', sent, unique_id='pool-sent')
+  client.meta.events.register('needs-retry', completed, unique_id='pool-completed')
+
+def get_pool_stats():
+  '''
+  Returns a copy of the connection pool counters per service.
+  '''
+  with POOL_LOCK:
+    return dict((k, dict(v)) for k, v in POOL_STATS.items())
+
+# Discards the shared session and clients
+def reset_clients():
+  with LOCK:
+    SESSION[0] = None
+    CLIENTS.clear()
@@ -1,6 +1,55 @@
+import os
+import re
+import time
 from functools import partial
-from .utils import paginated_response
-import boto3
+from .cache import TTLCache
+from .clients import get_client
+from .throttle import ThrottledClient
+from .executor import Asynchronous
+from .capacity import task_requirements, instance_capacity, shortfall
+from .metrics import timed, sleep
+from .utils import paginate, paginated_response, chunks, batches, concurrent_map
+from botocore.exceptions import ClientError
+
+# Maximum number of tasks that can be started in a single RunTask call
+RUN_TASK_LIMIT = 10
+
+# Sustained rate of RunTask calls per second, below the default rate of other ECS API operations
+RUN_TASK_RATE = float(os.environ.get('RUN_TASK_RATE', 10))
+
+# Maximum number of tasks that can be described in a single DescribeTasks call
+DESCRIBE_TASKS_LIMIT = 100
+
+# Task definition revisions are immutable, so lookups by revision are cached across warm invocations
+TASK_DEFINITION_CACHE = TTLCache(
+  maxsize=int(os.environ.get('TASK_DEFINITION_CACHE_SIZE', 128)),
+  ttl=int(os.environ.get('TASK_DEFINITION_CACHE_TTL', 3600))
+)
+
+# Maximum number of container instances that can be described in a single DescribeContainerInstances call
+DESCRIBE_CONTAINER_INSTANCES_LIMIT = 100
+
+# EC2 instance ID to container instance ARN index per cluster, shared across warm invocations
+CONTAINER_INSTANCE_CACHE = TTLCache(
+  maxsize=32,
+  ttl=int(os.environ.get('CONTAINER_INSTANCE_CACHE_TTL', 60))
+)
+
+# EC2 instance IDs per cluster that were not found in a freshly loaded container instance index
+MISSING_INSTANCE_CACHE = TTLCache(
+  maxsize=256,
+  ttl=int(os.environ.get('CONTAINER_INSTANCE_CACHE_TTL', 60))
+)
+
+# Registered and remaining resources of the active container instances per cluster, cached briefly across warm
+# invocations for the capacity preflight
+CLUSTER_CAPACITY_CACHE = TTLCache(
+  maxsize=32,
+  ttl=int(os.environ.get('CAPACITY_CACHE_TTL', 10))
+)
+
+# Matches task definition references that include a revision (family:revision or a full ARN)
+TASK_DEFINITION_REVISION = re.compile(r'^.+:\d+$')
 
 class EcsTaskFailureError(Exception):
     def __init__(self, task):
@@ -21,51 +70,236 @@ class EcsTaskTimeoutError(Exception):
         self.tasks = tasks
         self.taskArn = next((t['taskArn'] for t in tasks),None)
 
-class EcsTaskManager:
+# Merges tasks and failures from multiple RunTask, StartTask or DescribeTasks responses in order
+def merge_task_results(responses):
+  return {
+    'tasks': [t for r in responses for t in r.get('tasks', [])],
+    'failures': [f for r in responses for f in r.get('failures', [])]
+  }
+
+class EcsTaskManager(Asynchronous):
   """Handles ECS Tasks"""
-  def __init__(self):
-    self.client = boto3.client('ecs')
+  def __init__(self, client=None):
+    self._client = client
+
+  @property
+  def client(self):
+    if self._client is None:
+      self._client = get_client('ecs')
+    return self._client
+
+  @client.setter
+  def client(self, client):
+    self._client = client
+
+  # Rate limited client that retries throttled requests, used for all ECS API calls
+  @property
+  def api(self):
+    return ThrottledClient(self.client, 'ecs', {'run_task': RUN_TASK_RATE})
+
+  @timed('ecs.get_container_instance_index')
+  def get_container_instance_index(self, cluster, instance_ids=None):
+    '''
+    Returns a dictionary of EC2 instance ID to container instance ARN for all container instances in the cluster.
+    Each page of container instances is described while the next page is listed.
+    The index is cached per cluster and rebuilt if any of the given EC2 instance IDs are not in the cached index,
+    unless the index was just loaded.  EC2 instance IDs still not found are not looked up again until they expire.
+    '''
+    loaded = []
+    def load():
+      loaded.append(cluster)
+      return dict((c['ec2InstanceId'], c['containerInstanceArn']) for c in self.describe_container_instances(cluster))
+    index = CONTAINER_INSTANCE_CACHE.get_or_load(cluster, load)
+    unknown = [i for i in instance_ids or [] if i not in index and not MISSING_INSTANCE_CACHE.get((cluster, i))]
+    if unknown and not loaded:
+      index = load()
+      CONTAINER_INSTANCE_CACHE.set(cluster, index)
+    for i in unknown:
+      if i not in index:
+        MISSING_INSTANCE_CACHE.set((cluster, i), True)
+    return index
+
+  def describe_container_instances(self, cluster):
+    '''
+    Describes all container instances in the cluster, describing each page while the next page is listed.
+    '''
+    describe = lambda batch: self.api.describe_container_instances(
+      cluster=cluster, containerInstances=batch
+    ).get('containerInstances', [])
+    pages = batches(self.iter_container_instances(cluster), DESCRIBE_CONTAINER_INSTANCES_LIMIT)
+    return [c for b in concurrent_map(describe, pages) for c in b]
+
+  @timed('ecs.get_cluster_capacity')
+  def get_cluster_capacity(self, cluster, cached=True):
+    '''
+    Returns the registered and remaining resources of each active container instance in the cluster.
+    Unless 'cached' is False, a result loaded within the last CAPACITY_CACHE_TTL seconds is returned.
+    '''
+    load = lambda: [
+      instance_capacity(c) for c in self.describe_container_instances(cluster)
+      if c.get('status', 'ACTIVE') == 'ACTIVE' and c.get('agentConnected', True)
+    ]
+    if not cached:
+      CLUSTER_CAPACITY_CACHE.delete(cluster)
+    return CLUSTER_CAPACITY_CACHE.get_or_load(cluster, load)
+
+  @timed('ecs.check_capacity')
+  def check_capacity(self, cluster, task_definition, overrides, count, instances, cached=True):
+    '''
+    Compares the CPU and memory required by the tasks with the resources of the cluster's container instances,
+    or of the given instances (which each run one task).
+    Returns the failures expected if the tasks were started now, in the form of RunTask failures, and whether
+    the tasks could be placed later once running tasks release their resources.
+    '''
+    definition = self.describe_task_definition(task_definition, ttl=CLUSTER_CAPACITY_CACHE.ttl)
+    required = task_requirements(definition, overrides)
+    capacity = self.get_cluster_capacity(cluster, cached)
+    if not instances:
+      return shortfall(capacity, required, count)
+    by_arn = dict((c['containerInstanceArn'], c) for c in capacity)
+    failures, retryable = [], True
+    for arn in self.resolve_instances(cluster, instances):
+      if arn in by_arn:
+        instance_failures, instance_retryable = shortfall([by_arn[arn]], required, 1)
+      else:
+        instance_failures, instance_retryable = [{'reason': 'MISSING'}], False
+      failures += [dict(f, arn=arn) for f in instance_failures]
+      retryable = retryable and instance_retryable
+    return failures, retryable
 
   def get_container_instances(self, cluster, instance_ids):
-    containers = self.client.list_container_instances(cluster).get('containerInstanceArns')
-    describe_containers = self.client.describe_container_instances(cluster=cluster, containerInstances=containers).get('containerInstances')
-    return [c.get('containerInstanceArn') for c in describe_containers if c.get('ec2InstanceId') in instance_ids]
-    
+    index = self.get_container_instance_index(cluster, instance_ids)
+    return [index[i] for i in instance_ids if i in index]
+
+  # Resolves EC2 instance IDs to container instance ARNs, leaving container instance ARNs as is
+  def resolve_instances(self, cluster, instances):
+    instance_ids = [i for i in instances if i.startswith('i-')]
+    if not instance_ids:
+      return instances
+    index = self.get_container_instance_index(cluster, instance_ids)
+    missing = [i for i in instance_ids if i not in index]
+    if missing:
+      raise EcsTaskFailureError({'tasks': [], 'failures': [{'arn': i, 'reason': 'MISSING'} for i in missing]})
+    return [index.get(i, i) for i in instances]
+
+  @timed('ecs.list_container_instances')
   def list_container_instances(self, cluster):
-    func = partial(self.client.list_container_instances,cluster=cluster)
-    return paginated_response(func, 'containerInstanceArns')
+    return list(self.iter_container_instances(cluster))
+
+  def iter_container_instances(self, cluster):
+    func = partial(self.api.list_container_instances,cluster=cluster)
+    return paginate(func, 'containerInstanceArns', token_key='nextToken')
 
+  @timed('ecs.start_task')
   def start_task(self, cluster, task_definition, overrides, count, started_by, instances):
+    # Cached capacity no longer reflects the resources reserved by the started tasks
+    CLUSTER_CAPACITY_CACHE.delete(cluster)
     if instances:
-      return self.client.start_task(
+      instances = self.resolve_instances(cluster, instances)
+      return self.api.start_task(
         cluster=cluster, 
         taskDefinition=task_definition, 
         overrides=overrides, 
         containerInstances=instances, 
         startedBy=started_by
       )
-    else:
-      return self.client.run_task(
+    elif count <= RUN_TASK_LIMIT:
+      return self.api.run_task(
         cluster=cluster, 
         taskDefinition=task_definition, 
         overrides=overrides, 
         count=count, 
         startedBy=started_by
       )
+    else:
+      return self.run_tasks(cluster, task_definition, overrides, count, started_by)
 
+  @timed('ecs.run_tasks')
+  def run_tasks(self, cluster, task_definition, overrides, count, started_by):
+    '''
+    Starts more than RUN_TASK_LIMIT tasks using concurrent RunTask calls.
+    Calls that fail are reported as failures alongside the tasks and failures of successful calls.
+    If any call fails, the tasks that were started are stopped, as the request fails as a whole and would
+    otherwise leave them running untracked.  Tasks that cannot be stopped are added to the failures.
+    '''
+    def run(batch_count):
+      try:
+        return self.api.run_task(
+          cluster=cluster,
+          taskDefinition=task_definition,
+          overrides=overrides,
+          count=batch_count,
+          startedBy=started_by
+        )
+      except ClientError as e:
+        return {'tasks': [], 'failures': [{'reason': e.response.get('Error', {}).get('Code'), 'detail': str(e)}]}
+    batch_counts = [RUN_TASK_LIMIT] * (count // RUN_TASK_LIMIT) + ([count % RUN_TASK_LIMIT] if count % RUN_TASK_LIMIT else [])
+    result = merge_task_results(concurrent_map(run, batch_counts))
+    if result['failures'] and result['tasks']:
+      stopped = self.stop_tasks(cluster, [t['taskArn'] for t in result['tasks']], reason='RunTask failed for %s' % started_by)
+      result['failures'] += [{'arn': r['taskArn'], 'reason': 'STOP_FAILED', 'detail': str(r['error'])} for r in stopped if 'error' in r]
+    return result
+
+  @timed('ecs.describe_tasks')
   def describe_tasks(self, cluster, tasks):
-    return self.client.describe_tasks(cluster=cluster, tasks=tasks)
+    describe = lambda batch: self.api.describe_tasks(cluster=cluster, tasks=batch)
+    return merge_task_results(concurrent_map(describe, chunks(tasks, DESCRIBE_TASKS_LIMIT)))
+
+  @timed('ecs.describe_task_definition')
+  def describe_task_definition(self, task_definition, ttl=None):
+    '''
+    Describes a task definition, caching lookups by revision.
+    Lookups of the latest revision of a family are only cached if a 'ttl' is given.
+    '''
+    load = lambda: self.api.describe_task_definition(taskDefinition=task_definition)['taskDefinition']
+    if TASK_DEFINITION_REVISION.match(task_definition):
+      return TASK_DEFINITION_CACHE.get_or_load(task_definition, load)
+    if ttl:
+      return TASK_DEFINITION_CACHE.get_or_load(task_definition, load, ttl)
+    return load()
 
-  def describe_task_definition(self, task_definition):
-    response = self.client.describe_task_definition(taskDefinition=task_definition)
-    return response['taskDefinition']
+  @timed('ecs.list_tasks')
+  def list_tasks(self, cluster, max_items=None, **kwargs):
+    func = partial(self.api.list_tasks,cluster=cluster,**kwargs)
+    return paginated_response(func, 'taskArns', max_items, token_key='nextToken')
 
-  def list_tasks(self, cluster, **kwargs):
-    func = partial(self.client.list_tasks,cluster=cluster,**kwargs)
-    return paginated_response(func, 'taskArns')
+  def iter_tasks(self, cluster, **kwargs):
+    func = partial(self.api.list_tasks,cluster=cluster,**kwargs)
+    return paginate(func, 'taskArns', token_key='nextToken')
 
+  @timed('ecs.stop_task')
   def stop_task(self, cluster, task, reason='unknown'):
-    return self.client.stop_task(cluster=cluster, task=task, reason=reason)
+    return self.api.stop_task(cluster=cluster, task=task, reason=reason)
+
+  @timed('ecs.stop_tasks')
+  def stop_tasks(self, cluster, tasks, reason='unknown', wait=False, timeout=60, poll_interval=5):
+    '''
+    Stops tasks concurrently.
+    Returns a result per task with the task ARN and either the task's last status or the error that occurred.
+    If 'wait' is set, waits up to 'timeout' seconds for the stopped tasks to reach the STOPPED status.
+    '''
+    def stop(task):
+      try:
+        response = self.stop_task(cluster=cluster, task=task, reason=reason)
+        return {'taskArn': task, 'lastStatus': response.get('task', {}).get('lastStatus')}
+      except ClientError as e:
+        return {'taskArn': task, 'error': e}
+    results = concurrent_map(stop, tasks)
+    if wait:
+      self.wait_for_stopped(cluster, [r['taskArn'] for r in results if 'error' not in r], results, timeout, poll_interval)
+    return results
+
+  @timed('ecs.wait_for_stopped')
+  def wait_for_stopped(self, cluster, tasks, results, timeout, poll_interval):
+    deadline = time.time() + timeout
+    statuses = dict((r['taskArn'], r) for r in results)
+    pending = [t for t in tasks if statuses[t].get('lastStatus') != 'STOPPED']
+    while pending and time.time() < deadline:
+      sleep(min(poll_interval, max(deadline - time.time(), 0)))
+      described = self.describe_tasks(cluster=cluster, tasks=pending).get('tasks', [])
+      for t in described:
+        statuses[t['taskArn']]['lastStatus'] = t.get('lastStatus')
+      pending = [t for t in pending if statuses[t].get('lastStatus') != 'STOPPED']
 
   # Checks ECS task completion
   def check_status(self, tasks):
@@ -76,4 +310,18 @@ class EcsTaskManager:
       status = 'RUNNING'
     else:
       status = 'STOPPED'
+    return status
+
+  # Checks aggregate status of a batch of task specs, which is only STOPPED or FAILED once every spec has finished
+  # Specs whose launch is queued are pending
+  def check_batch_status(self, specs):
+    stats = [s.get('Status') for s in specs]
+    if 'PENDING' in stats or 'QUEUED' in stats:
+      status = 'PENDING'
+    elif 'RUNNING' in stats:
+      status = 'RUNNING'
+    elif 'FAILED' in stats:
+      status = 'FAILED'
+    else:
+      status = 'STOPPED'
     return status
\ No newline at end of file
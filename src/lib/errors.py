@@ -1,6 +1,8 @@
 import logging
-import json
-from datetime import datetime
+import threading
+from .formatting import json_native
+from .throttle import begin_invocation, get_stats
+from .metrics import begin, end, increment, timed
 from ecs import EcsTaskFailureError, EcsTaskExitCodeError, EcsTaskTimeoutError
 from voluptuous import MultipleInvalid, Invalid
 from cfn_lambda_handler import CfnLambdaExecutionTimeout
@@ -8,8 +10,48 @@ from botocore.exceptions import ClientError
 
 log = logging.getLogger()
 
+# Converts the handler result to JSON native values, recording the time taken
+serialize = timed('serialize')(json_native)
+
+# Number of handlers currently running, as the batch handlers call the task handlers for each spec
+ACTIVE_HANDLERS = [0]
+LOCK = threading.Lock()
+
+def begin_handler(func, context):
+  '''
+  Resets the throttling counters and starts recording metrics if called from the outermost handler of an invocation,
+  so that nested handlers (e.g. run for each spec of a batch) are recorded as part of the outer invocation.
+  Returns True for the outermost handler.
+  '''
+  with LOCK:
+    ACTIVE_HANDLERS[0] += 1
+    outermost = ACTIVE_HANDLERS[0] == 1
+  if outermost:
+    begin_invocation(context)
+    begin('%s.%s' % (func.__module__, func.__name__))
+  return outermost
+
+def end_handler(outermost, failed):
+  '''
+  Logs throttled requests and writes the metrics summary once the outermost handler of an invocation completes.
+  '''
+  with LOCK:
+    ACTIVE_HANDLERS[0] -= 1
+  if outermost:
+    log_throttling()
+    if failed:
+      increment('Failed')
+    end()
+
+# Logs the API operations that were throttled during the invocation
+def log_throttling():
+  throttled = dict((k, v) for k, v in get_stats().items() if v['throttles'])
+  if throttled:
+    log.warning("Throttled AWS API requests: %s", throttled)
+
 def ecs_error_handler(func):
   def handle_task_result(event, context):
+    outermost = begin_handler(func, context)
     try:
       event = func(event, context)
     except ClientError as e:
@@ -33,11 +75,14 @@ def ecs_error_handler(func):
     finally:
       if event['Status'] == "FAILED":
         log.error(event['Reason'])
-      return json.loads(json.dumps(event, default=lambda d: d.isoformat() if isinstance(d, datetime) else str(d)))
+      result = serialize(event)
+      end_handler(outermost, event['Status'] == "FAILED")
+      return result
   return handle_task_result
 
 def cfn_error_handler(func):
   def handle_task_result(event, context):
+    outermost = begin_handler(func, context)
     try:
       event = func(event, context)
     except EcsTaskFailureError as e:
@@ -53,11 +98,14 @@ def cfn_error_handler(func):
       event['Reason'] = "The task failed to complete with the specified timeout of %s seconds" % e.timeout
       event['PhysicalResourceId'] = e.taskArn or event['PhysicalResourceId']
     except CfnLambdaExecutionTimeout:
+      increment('Reinvoked')
       raise
     except (Invalid, MultipleInvalid) as e:
       event['Status'] = "FAILED"
       event['Reason'] = "One or more invalid event properties: %s" % e  
-    if event.get('Status') == "FAILED":
-      log.error(event['Reason'])
+    finally:
+      if event.get('Status') == "FAILED":
+        log.error(event['Reason'])
+      end_handler(outermost, event.get('Status') == "FAILED")
     return event
   return handle_task_result
\ No newline at end of file
@@ -0,0 +1,133 @@
+import json
+import time
+from .clients import get_client
+from .throttle import ThrottledClient
+from .metrics import sleep
+try:
+  from Queue import Queue, Empty
+except ImportError:
+  from queue import Queue, Empty
+
+# Interval at which file based queues are checked for new events
+FILE_POLL_INTERVAL = 1
+
+# Maximum long polling wait supported by SQS
+SQS_MAX_WAIT = 20
+
+# Named in-memory queues, shared for the lifetime of the process
+MEMORY_QUEUES = {}
+
+# File and SQS queues per URL, shared across warm invocations so that file offsets and clients are reused
+EVENT_QUEUES = {}
+
+class MemoryEventQueue:
+  """In-memory queue of ECS task state change events"""
+  def __init__(self):
+    self.queue = Queue()
+
+  def put(self, event):
+    self.queue.put(event)
+
+  def receive(self, wait_seconds, task_arns=None):
+    try:
+      events = [self.queue.get(timeout=max(wait_seconds, 0))]
+    except Empty:
+      return []
+    while not self.queue.empty():
+      events.append(self.queue.get_nowait())
+    return events
+
+class FileEventQueue:
+  """Queue of ECS task state change events appended as JSON lines to a local file"""
+  def __init__(self, path):
+    self.path = path
+    self.offset = 0
+
+  def put(self, event):
+    with open(self.path, 'a') as f:
+      f.write(json.dumps(event) + '\n')
+
+  def read(self):
+    try:
+      with open(self.path) as f:
+        f.seek(self.offset)
+        lines = f.readlines()
+        self.offset = f.tell()
+    except IOError:
+      return []
+    return [json.loads(l) for l in lines if l.strip()]
+
+  def receive(self, wait_seconds, task_arns=None):
+    attempts = max(int(wait_seconds // FILE_POLL_INTERVAL), 1)
+    for attempt in range(attempts):
+      events = self.read()
+      if events or attempt == attempts - 1:
+        return events
+      sleep(FILE_POLL_INTERVAL)
+
+class SqsEventQueue:
+  """SQS queue subscribed to ECS task state change events via a CloudWatch Events rule"""
+  def __init__(self, queue_url):
+    self.queue_url = queue_url
+    self.client = get_client('sqs')
+    self.api = ThrottledClient(self.client, 'sqs')
+
+  def receive(self, wait_seconds, task_arns=None):
+    '''
+    Receives up to 10 events, deleting only the messages for the given tasks (or all messages if not given).
+    Messages for other tasks are left on the queue for other pollers, and become visible again once their
+    visibility timeout expires.
+    '''
+    response = self.api.receive_message(
+      QueueUrl=self.queue_url,
+      MaxNumberOfMessages=10,
+      WaitTimeSeconds=int(min(max(wait_seconds, 0), SQS_MAX_WAIT))
+    )
+    messages = [(m, parse_message(m['Body'])) for m in response.get('Messages', [])]
+    watched = [m for m, e in messages if task_arns is None or get_task_arn(e) in task_arns]
+    if watched:
+      self.api.delete_message_batch(
+        QueueUrl=self.queue_url,
+        Entries=[{'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(watched)]
+      )
+    return [e for _, e in messages]
+
+# Parses an SQS message body, unwrapping SNS notifications
+def parse_message(body):
+  event = json.loads(body)
+  if 'Message' in event and 'detail' not in event:
+    event = json.loads(event['Message'])
+  return event
+
+def get_task_arn(event):
+  return (event.get('detail') or {}).get('taskArn')
+
+# Returns the event queue for a given queue URL, created on first use
+def get_event_queue(url):
+  if url.startswith('memory://'):
+    return MEMORY_QUEUES.setdefault(url[len('memory://'):], MemoryEventQueue())
+  queue = EVENT_QUEUES.get(url)
+  if queue is None:
+    queue = EVENT_QUEUES[url] = FileEventQueue(url[len('file://'):]) if url.startswith('file://') else SqsEventQueue(url)
+  return queue
+
+def wait_for_stopped(queue, task_arns, timeout):
+  '''
+  Consumes ECS task state change events until each of the given tasks has reached STOPPED.
+  Returns True as soon as all tasks have stopped, or False if the timeout is reached first.
+  '''
+  watched = set(task_arns)
+  pending = set(watched)
+  deadline = time.time() + timeout
+  while pending:
+    remaining = deadline - time.time()
+    if remaining <= 0:
+      return False
+    events = queue.receive(remaining, task_arns=watched)
+    if not events:
+      return False
+    for event in events:
+      detail = event.get('detail') or {}
+      if detail.get('lastStatus') == 'STOPPED':
+        pending.discard(detail.get('taskArn'))
+  return True
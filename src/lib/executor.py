@@ -0,0 +1,61 @@
+import os
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait
+from .utils import MAX_WORKERS
+
+# Number of threads running independent AWS API calls submitted by the handlers
+EXECUTOR_WORKERS = int(os.environ.get('EXECUTOR_WORKERS', MAX_WORKERS))
+
+# Executor shared across warm invocations, created on first use
+EXECUTOR = [None]
+LOCK = threading.Lock()
+
+def get_executor():
+  executor = EXECUTOR[0]
+  if executor is None:
+    with LOCK:
+      executor = EXECUTOR[0]
+      if executor is None:
+        executor = EXECUTOR[0] = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS)
+  return executor
+
+def submit(func, *args, **kwargs):
+  '''
+  Runs func(*args, **kwargs) on the shared executor, returning a future for its result.
+  Only handler code should wait on the returned futures, as functions that wait on the shared executor
+  from one of its own threads can deadlock once all threads are busy.
+  '''
+  return get_executor().submit(func, *args, **kwargs)
+
+def gather(futures):
+  '''
+  Waits for all futures and returns their results in order, raising the first error once all have finished.
+  '''
+  futures = list(futures)
+  errors = [f.exception() for f in futures]
+  error = next((e for e in errors if e is not None), None)
+  if error is not None:
+    raise error
+  return [f.result() for f in futures]
+
+def settle(futures):
+  '''
+  Waits for all futures to complete, ignoring their results and errors.
+  '''
+  wait(list(futures))
+
+def shutdown():
+  with LOCK:
+    executor, EXECUTOR[0] = EXECUTOR[0], None
+  if executor is not None:
+    executor.shutdown(wait=True)
+
+class Asynchronous(object):
+  """Adds a '<method>_async' variant of each method that runs the method on the shared executor and returns a future"""
+  def __getattr__(self, name):
+    if name.endswith('_async') and not name.startswith('_'):
+      method = getattr(self, name[:-len('_async')])
+      if callable(method):
+        return partial(submit, method)
+    raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
@@ -0,0 +1,75 @@
+import os
+import json
+from datetime import datetime
+
+# Maximum length of serialized data written to a single log message
+MAX_LOG_LENGTH = int(os.environ.get('MAX_LOG_LENGTH', 4096))
+
+# Maximum number of tasks and failures listed individually in a task result summary
+MAX_SUMMARY_ITEMS = 10
+
+# Outputs JSON
+def format_json(data):
+  return json.dumps(data, default=lambda d: d.isoformat() if isinstance(d, datetime) else str(d))
+
+# Converts values that are not JSON native (e.g. datetimes) to strings, copying only the containers that change
+def json_native(node):
+  if isinstance(node, dict):
+    items = [(k, json_native(v)) for k,v in node.items()]
+    if all(v is node[k] for k,v in items):
+      return node
+    return dict(items)
+  elif isinstance(node, (list, tuple)):
+    items = [json_native(v) for v in node]
+    if isinstance(node, list) and all(v is n for v,n in zip(items, node)):
+      return node
+    return items
+  elif node is None or isinstance(node, (basestring, bool, int, long, float)):
+    return node
+  elif isinstance(node, datetime):
+    return node.isoformat()
+  else:
+    return str(node)
+
+# Summarizes a task result as task counts by status, with at most MAX_SUMMARY_ITEMS tasks and failures listed
+def summarize_tasks(task_result):
+  tasks = task_result.get('tasks') or []
+  failures = task_result.get('failures') or []
+  statuses = {}
+  for t in tasks:
+    statuses[t.get('lastStatus')] = statuses.get(t.get('lastStatus'), 0) + 1
+  summary = {
+    'count': len(tasks),
+    'statuses': statuses,
+    'tasks': [{
+      'taskArn': t.get('taskArn'),
+      'lastStatus': t.get('lastStatus'),
+      'exitCodes': [c.get('exitCode') for c in t.get('containers', [])]
+    } for t in tasks[:MAX_SUMMARY_ITEMS]],
+    'failures': failures[:MAX_SUMMARY_ITEMS]
+  }
+  if len(tasks) > MAX_SUMMARY_ITEMS or len(failures) > MAX_SUMMARY_ITEMS:
+    summary['truncated'] = True
+  return summary
+
+class LazyFormat(object):
+  """Defers formatting of a log message argument until the message is emitted"""
+  def __init__(self, func, *args):
+    self.func = func
+    self.args = args
+
+  def __str__(self):
+    return self.func(*self.args)
+
+# Capped JSON serialization of data, evaluated only if the log message is emitted
+def lazy_json(data):
+  def capped():
+    output = format_json(data)
+    if len(output) > MAX_LOG_LENGTH:
+      return '%s... (%d characters truncated)' % (output[:MAX_LOG_LENGTH], len(output) - MAX_LOG_LENGTH)
+    return output
+  return LazyFormat(capped)
+
+# Task result summary, evaluated only if the log message is emitted
+def task_summary(task_result):
+  return LazyFormat(lambda: format_json(summarize_tasks(task_result)))
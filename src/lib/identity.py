@@ -0,0 +1,30 @@
+import re
+from hashlib import md5
+
+# Maximum length of the task ARNs returned in custom resource response data, within the 4KB response limit
+MAX_DATA_LENGTH = 2048
+
+# Matches task ARNs in both the old (task/id) and new (task/cluster/id) formats
+TASK_ARN = re.compile(r'^arn:aws[\w-]*:ecs:[\w-]+:\d{12}:task/[\w/-]+$')
+
+def task_id(*parts):
+  '''
+  Returns a stable 32 character hexadecimal ID for the given parts (e.g. a stack ID and logical resource ID),
+  within the 36 character limit of the startedBy value of tasks.
+  Parts are UTF-8 encoded, so the ID of ASCII parts is the MD5 digest of their concatenation.
+  '''
+  m = md5()
+  for part in parts:
+    m.update(part.encode('utf-8') if isinstance(part, unicode) else part)
+  return m.hexdigest()
+
+def is_task_arn(value):
+  return isinstance(value, basestring) and TASK_ARN.match(value) is not None
+
+def task_data(task_arns):
+  '''
+  Returns custom resource response data listing the launched task ARNs, available via Fn::GetAtt.
+  The ARNs are omitted if they do not fit within MAX_DATA_LENGTH.
+  '''
+  joined = ','.join(task_arns)
+  return {'TaskArns': joined} if len(joined) <= MAX_DATA_LENGTH else {}
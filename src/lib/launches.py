@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from botocore.exceptions import ClientError
+from .ecs import EcsTaskFailureError, RUN_TASK_LIMIT
+from .formatting import json_native
+from .snapshot import select, snapshot_result
+from .metrics import increment, timed
+
+log = logging.getLogger()
+
+# Status of a task spec or resource whose launch is held in the launch queue until the cluster has capacity
+QUEUED = 'QUEUED'
+
+# Maximum number of launches from the queue per cluster whose tasks have not yet finished
+LAUNCH_CONCURRENCY = int(os.environ.get('LAUNCH_CONCURRENCY', 10))
+
+# Path of the SQLite database holding the launch queue
+LAUNCH_STORE = os.environ.get('LAUNCH_STORE', '/tmp/ecs-tasks-launches.db')
+
+# Seconds that finished, failed and expired launches are kept after they expire
+LAUNCH_RETENTION = 300
+
+# Task properties needed to start a queued launch
+SPEC_FIELDS = ['Cluster', 'TaskDefinition', 'Overrides', 'Count', 'Instances', 'StartedBy', 'Preflight', 'Detail']
+
+# Launch statuses that hold one of the cluster's launch slots
+ACTIVE_STATES = ['LAUNCHING', 'LAUNCHED']
+
+class SqliteLaunchStore:
+  """
+  Launch queue persisted in a SQLite database, shared by all processes that can open the database file.
+  Any object with the same add, claim, update, finish and get methods can be used as a launch store.
+  """
+  def __init__(self, path):
+    self.path = path
+    with self.transaction() as db:
+      db.execute(
+        'CREATE TABLE IF NOT EXISTS launches ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, cluster TEXT NOT NULL, priority INTEGER NOT NULL, '
+        'status TEXT NOT NULL, spec TEXT NOT NULL, result TEXT, expires REAL NOT NULL)'
+      )
+
+  def transaction(self):
+    db = sqlite3.connect(self.path, timeout=30, isolation_level='IMMEDIATE')
+    return Transaction(db)
+
+  # Adds a queued launch, returning its ID
+  def add(self, cluster, priority, spec, expires):
+    with self.transaction() as db:
+      return db.execute(
+        'INSERT INTO launches (cluster, priority, status, spec, expires) VALUES (?, ?, ?, ?, ?)',
+        (cluster, priority, QUEUED, json.dumps(spec), expires)
+      ).lastrowid
+
+  def claim(self, cluster, limit, now):
+    '''
+    Expires the cluster's launches that have passed their expiry, then marks queued launches as LAUNCHING
+    in priority, then FIFO, order until 'limit' launches are active.  Returns the claimed launch IDs and specs.
+    '''
+    with self.transaction() as db:
+      db.execute(
+        'DELETE FROM launches WHERE cluster = ? AND status NOT IN (?, ?, ?) AND expires < ?',
+        (cluster, QUEUED, 'LAUNCHING', 'LAUNCHED', now - LAUNCH_RETENTION)
+      )
+      db.execute(
+        'UPDATE launches SET status = ? WHERE cluster = ? AND status IN (?, ?, ?) AND expires < ?',
+        ('EXPIRED', cluster, QUEUED, 'LAUNCHING', 'LAUNCHED', now)
+      )
+      active = db.execute(
+        'SELECT COUNT(*) FROM launches WHERE cluster = ? AND status IN (?, ?)', [cluster] + ACTIVE_STATES
+      ).fetchone()[0]
+      claimed = db.execute(
+        'SELECT id, spec FROM launches WHERE cluster = ? AND status = ? ORDER BY priority DESC, id LIMIT ?',
+        (cluster, QUEUED, max(limit - active, 0))
+      ).fetchall()
+      db.executemany('UPDATE launches SET status = ? WHERE id = ?', [('LAUNCHING', i) for i, _ in claimed])
+    return [(i, json.loads(spec)) for i, spec in claimed]
+
+  def update(self, launch_id, status, result=None):
+    with self.transaction() as db:
+      db.execute(
+        'UPDATE launches SET status = ?, result = ? WHERE id = ?',
+        (status, json.dumps(json_native(result)) if result is not None else None, launch_id)
+      )
+
+  # Releases the slot of a launch whose tasks have finished
+  def finish(self, launch_id):
+    with self.transaction() as db:
+      db.execute('UPDATE launches SET status = ? WHERE id = ? AND status = ?', ('FINISHED', launch_id, 'LAUNCHED'))
+
+  def get(self, launch_id):
+    with self.transaction() as db:
+      row = db.execute('SELECT status, result FROM launches WHERE id = ?', (launch_id,)).fetchone()
+    if row is None:
+      return None
+    return {'Status': row[0], 'Result': json.loads(row[1]) if row[1] else None}
+
+class Transaction:
+  """Commits (or rolls back) a SQLite connection's transaction and closes the connection"""
+  def __init__(self, db):
+    self.db = db
+
+  def __enter__(self):
+    return self.db
+
+  def __exit__(self, *exc_info):
+    try:
+      if exc_info[0] is None:
+        self.db.commit()
+      else:
+        self.db.rollback()
+    finally:
+      self.db.close()
+
+# Launch store shared across warm invocations, created on first use
+STORE = [None]
+LOCK = threading.Lock()
+
+def get_launch_store():
+  with LOCK:
+    if STORE[0] is None:
+      STORE[0] = SqliteLaunchStore(LAUNCH_STORE)
+    return STORE[0]
+
+def set_launch_store(store):
+  '''
+  Sets the store that launches are queued in, returning the previous store.
+  '''
+  with LOCK:
+    previous, STORE[0] = STORE[0], store
+  return previous
+
+def enqueue(task, priority, expires):
+  '''
+  Queues the launch of a task until the cluster has capacity, returning the launch ID.
+  The launch expires if it has not been started by the 'expires' timestamp.
+  '''
+  increment('launch.Queued')
+  return get_launch_store().add(task['Cluster'], priority, json_native(select(task, SPEC_FIELDS)), expires)
+
+# Returns True if all failures are placement failures due to insufficient cluster resources
+def is_capacity_failure(result):
+  failures = result.get('failures', [])
+  return bool(failures) and all((f.get('reason') or '').startswith('RESOURCE:') for f in failures)
+
+def start(task_mgr, spec):
+  '''
+  Starts a queued launch, returning its result or None if the cluster does not have capacity for it yet.
+  Tasks started by a single call that did not place every task are stopped before the launch is queued again,
+  as concurrent RunTask calls already stop the tasks they started.
+  '''
+  if spec['Preflight'] != 'Off':
+    failures, retryable = task_mgr.check_capacity(
+      cluster=spec['Cluster'],
+      task_definition=spec['TaskDefinition'],
+      overrides=spec['Overrides'],
+      count=spec['Count'],
+      instances=spec['Instances'],
+      cached=False
+    )
+    if failures:
+      return None if retryable else {'tasks': [], 'failures': failures}
+  result = task_mgr.start_task(
+    cluster=spec['Cluster'],
+    task_definition=spec['TaskDefinition'],
+    overrides=spec['Overrides'],
+    count=spec['Count'],
+    instances=spec['Instances'],
+    started_by=spec['StartedBy']
+  )
+  if not is_capacity_failure(result):
+    return result
+  if result['tasks'] and (spec['Instances'] or spec['Count'] <= RUN_TASK_LIMIT):
+    task_mgr.stop_tasks(spec['Cluster'], [t['taskArn'] for t in result['tasks']], reason='Launch queued for %s' % spec['StartedBy'])
+  return None
+
+@timed('launch.dispatch')
+def dispatch(task_mgr, cluster):
+  '''
+  Starts the cluster's queued launches in priority, then FIFO, order while fewer than LAUNCH_CONCURRENCY
+  launches are active.  Dispatching stops at the first launch that does not fit, which is queued again
+  along with the launches after it, so that smaller launches do not starve larger ones.
+  '''
+  store = get_launch_store()
+  claimed = store.claim(cluster, LAUNCH_CONCURRENCY, time.time())
+  for index, (launch_id, spec) in enumerate(claimed):
+    try:
+      result = start(task_mgr, spec)
+    except (ClientError, EcsTaskFailureError) as e:
+      failures = getattr(e, 'failures', None) or [{'reason': 'ERROR', 'detail': str(e)}]
+      result = {'tasks': [], 'failures': failures}
+    if result is None:
+      for i, _ in claimed[index:]:
+        store.update(i, QUEUED)
+      return
+    status = 'FAILED' if result['failures'] else 'LAUNCHED'
+    log.info('Launch %s of %s %s', launch_id, spec['StartedBy'], status.lower())
+    increment('launch.' + status.capitalize())
+    store.update(launch_id, status, snapshot_result(result, spec['Detail']))
+
+def check_launch(task_mgr, cluster, launch_id):
+  '''
+  Dispatches the cluster's queued launches and returns the result of the given launch once it has started,
+  or None while it is still queued.  Raises EcsTaskFailureError if the launch failed or expired.
+  '''
+  dispatch(task_mgr, cluster)
+  launch = get_launch_store().get(launch_id) or {'Status': 'EXPIRED'}
+  if launch['Status'] == 'EXPIRED':
+    raise EcsTaskFailureError({'tasks': [], 'failures': [{'reason': 'EXPIRED', 'detail': 'Launch %s was not started in time' % launch_id}]})
+  if launch['Status'] == 'FAILED':
+    raise EcsTaskFailureError(launch['Result'])
+  if launch['Status'] in [QUEUED, 'LAUNCHING']:
+    return None
+  return launch['Result']
+
+def finish_launch(launch_id):
+  '''
+  Releases the launch slot held by a launch whose tasks have finished (or failed), if the tasks were queued.
+  '''
+  if launch_id is not None:
+    get_launch_store().finish(launch_id)
@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import threading
+from functools import wraps
+
+# CloudWatch namespace of the metrics summary written at the end of each invocation, or empty to disable the summary
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'EcsTasks')
+
+class Recorder(object):
+  """Accumulates call counts, latencies and counters for a single invocation"""
+  def __init__(self, handler=None):
+    self.handler = handler
+    self.started = time.time()
+    self.timings = {}
+    self.counters = {}
+    self.lock = threading.Lock()
+
+  def record(self, name, seconds):
+    with self.lock:
+      timing = self.timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+      timing['count'] += 1
+      timing['total'] += seconds
+      timing['max'] = max(timing['max'], seconds)
+
+  def add(self, name, value=1):
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + value
+
+  # Returns an embedded metric format summary, with each timing reported as a count and total time in milliseconds
+  def summary(self, now):
+    values = {'Duration': (now - self.started) * 1000}
+    units = {'Duration': 'Milliseconds'}
+    with self.lock:
+      for name, timing in self.timings.items():
+        values[name + '.Count'], units[name + '.Count'] = timing['count'], 'Count'
+        values[name + '.Time'], units[name + '.Time'] = timing['total'] * 1000, 'Milliseconds'
+        values[name + '.MaxTime'], units[name + '.MaxTime'] = timing['max'] * 1000, 'Milliseconds'
+      for name, value in self.counters.items():
+        values[name], units[name] = value, 'Count'
+    summary = {
+      '_aws': {
+        'Timestamp': int(now * 1000),
+        'CloudWatchMetrics': [{
+          'Namespace': NAMESPACE,
+          'Dimensions': [['Handler']],
+          'Metrics': [{'Name': name, 'Unit': units[name]} for name in sorted(units)]
+        }]
+      },
+      'Handler': self.handler
+    }
+    summary.update(values)
+    return summary
+
+class StdoutSink(object):
+  """Writes each summary as a single JSON line on stdout, where CloudWatch Logs extracts the metrics"""
+  def emit(self, summary):
+    sys.stdout.write(json.dumps(summary, sort_keys=True) + '\n')
+    sys.stdout.flush()
+
+class MemorySink(object):
+  """Keeps each summary in memory"""
+  def __init__(self):
+    self.summaries = []
+
+  def emit(self, summary):
+    self.summaries.append(summary)
+
+# Recorder of the current invocation and the sink summaries are written to
+RECORDER = [Recorder()]
+SINK = [StdoutSink()]
+
+def set_sink(sink):
+  '''
+  Sets the sink that invocation summaries are written to, returning the previous sink.
+  '''
+  previous, SINK[0] = SINK[0], sink
+  return previous
+
+def begin(handler):
+  '''
+  Starts recording metrics for an invocation of the named handler.
+  '''
+  RECORDER[0] = Recorder(handler)
+
+def end():
+  '''
+  Writes the summary of the current invocation to the sink (unless METRICS_NAMESPACE is empty) and returns it.
+  '''
+  summary = RECORDER[0].summary(time.time())
+  if NAMESPACE:
+    SINK[0].emit(summary)
+  return summary
+
+def record(name, seconds):
+  RECORDER[0].record(name, seconds)
+
+def increment(name, value=1):
+  RECORDER[0].add(name, value)
+
+def timed(name):
+  '''
+  Decorator that records the count and latency of calls to the decorated function under 'name'.
+  '''
+  def decorator(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+      started = time.time()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        record(name, time.time() - started)
+    return wrapper
+  return decorator
+
+def sleep(seconds):
+  '''
+  Sleeps for 'seconds', recording the time spent sleeping.
+  '''
+  record('sleep', seconds)
+  time.sleep(seconds)
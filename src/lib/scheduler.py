@@ -0,0 +1,78 @@
+import random
+from .utils import to_timestamp
+
+# Shortest interval between task status checks
+MIN_INTERVAL = 2
+
+# Growth factor applied to the interval after each check
+BACKOFF = 2
+
+# Proportion of random variation applied to each interval
+JITTER = 0.2
+
+# Time in seconds reserved at the end of a Lambda invocation for the final status check and re-invocation
+SAFETY_MARGIN = 5
+
+# Weight given to the most recent observation when updating task timings
+SMOOTHING = 0.5
+
+# Observed (pending, running) durations in seconds keyed by task definition ARN, shared across warm invocations
+OBSERVED_TIMINGS = {}
+
+# Records PENDING -> RUNNING -> STOPPED durations of stopped tasks as a moving average per task definition
+def record_timings(task_result):
+  for t in task_result.get('tasks', []):
+    created, started, stopped = [to_timestamp(t.get(k)) for k in ('createdAt', 'startedAt', 'stoppedAt')]
+    if t.get('lastStatus') != 'STOPPED' or None in (created, started, stopped):
+      continue
+    observed = (started - created, stopped - started)
+    previous = OBSERVED_TIMINGS.get(t.get('taskDefinitionArn'), observed)
+    OBSERVED_TIMINGS[t.get('taskDefinitionArn')] = tuple(
+      SMOOTHING * o + (1 - SMOOTHING) * p for o, p in zip(observed, previous)
+    )
+
+# Returns the number of seconds until all tasks are expected to stop based on observed timings, if known
+def expected_completion(task_result, now):
+  expected = []
+  for t in task_result.get('tasks', []):
+    timings = OBSERVED_TIMINGS.get(t.get('taskDefinitionArn'))
+    if t.get('lastStatus') == 'STOPPED':
+      continue
+    if not timings:
+      return None
+    started = to_timestamp(t.get('startedAt'))
+    created = to_timestamp(t.get('createdAt'))
+    if started is not None:
+      expected.append(started + timings[1] - now)
+    elif created is not None:
+      expected.append(created + sum(timings) - now)
+    else:
+      return None
+  return max(expected) if expected else None
+
+class PollScheduler:
+  """Schedules task status checks with jittered exponential backoff bounded by the Lambda execution budget"""
+  def __init__(self, max_interval, attempt=0, min_interval=MIN_INTERVAL):
+    self.max_interval = max_interval
+    self.min_interval = min(min_interval, max_interval)
+    self.attempt = attempt
+
+  def next_interval(self, task_result, now):
+    interval = min(self.min_interval * BACKOFF ** self.attempt, self.max_interval)
+    expected = expected_completion(task_result, now)
+    # Tasks already overdue against their observed timings keep backing off exponentially
+    if expected is not None and expected > 0:
+      interval = min(max(expected, self.min_interval), self.max_interval)
+    self.attempt += 1
+    jittered = interval * random.uniform(1 - JITTER, 1 + JITTER)
+    return min(max(jittered, self.min_interval), self.max_interval)
+
+  def fit(self, interval, remaining_millis):
+    '''
+    Shortens the interval so the following status check completes within the remaining Lambda execution time.
+    Returns None if there is not enough time remaining for another check.
+    '''
+    budget = remaining_millis / 1000.0 - SAFETY_MARGIN
+    if budget < self.min_interval:
+      return None
+    return min(interval, budget)
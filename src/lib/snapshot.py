@@ -0,0 +1,35 @@
+# Task fields retained in a snapshot, in addition to container exit codes
+TASK_FIELDS = ['taskArn', 'lastStatus', 'stoppedReason']
+
+# Container fields retained in a snapshot
+CONTAINER_FIELDS = ['name', 'exitCode']
+
+# Returns a copy of a dictionary with only the given keys that are present
+def select(item, keys):
+  return dict((k, item[k]) for k in keys if k in item)
+
+# Compact representation of a task holding its ARN, last status, stopped reason and container exit codes
+def snapshot_task(task):
+  result = select(task, TASK_FIELDS)
+  result['containers'] = [select(c, CONTAINER_FIELDS) for c in task.get('containers', [])]
+  return result
+
+def snapshot_tasks(tasks, detail=False):
+  '''
+  Returns compact task snapshots for storing in Step Functions state and poll events.
+  The full task descriptions are returned if 'detail' is set.
+  '''
+  if detail:
+    return tasks
+  return [snapshot_task(t) for t in tasks]
+
+def snapshot_result(task_result, detail=False):
+  '''
+  Returns a task result with compact task snapshots, or the full task result if 'detail' is set.
+  '''
+  if detail:
+    return task_result
+  return {
+    'tasks': snapshot_tasks(task_result.get('tasks', [])),
+    'failures': task_result.get('failures', [])
+  }
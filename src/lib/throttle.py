@@ -0,0 +1,173 @@
+import os
+import time
+import random
+import threading
+from functools import partial
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+from .clients import RETRY_MODE
+from .scheduler import SAFETY_MARGIN
+from .metrics import record, increment, sleep
+
+# Error codes returned when AWS API requests are throttled
+THROTTLING_ERRORS = ['Throttling', 'ThrottlingException', 'TooManyRequestsException', 'RequestLimitExceeded']
+
+# Error codes and HTTP status codes of transient errors, retried in the standard and adaptive retry modes
+TRANSIENT_ERRORS = ['RequestTimeout', 'RequestTimeoutException', 'PriorRequestNotComplete']
+TRANSIENT_STATUS_CODES = [500, 502, 503, 504]
+
+# Default sustained rate (calls per second) and burst size of each API operation
+API_RATE = float(os.environ.get('API_RATE', 20))
+API_BURST = int(os.environ.get('API_BURST', 50))
+
+# Maximum number of attempts for a throttled request and backoff bounds in seconds
+MAX_ATTEMPTS = int(os.environ.get('API_MAX_ATTEMPTS', 6))
+BASE_DELAY = 0.5
+MAX_DELAY = 10
+
+# Token buckets per service operation, shared by all clients and invocations in the process
+BUCKETS = {}
+
+# Call, throttle and retry counts per service operation for the current invocation
+STATS = {}
+
+LOCK = threading.Lock()
+
+# Returns the remaining Lambda execution time in milliseconds for the current invocation, if known
+REMAINING_TIME = [None]
+
+def is_throttled(error):
+  '''
+  Returns True if the error is a throttled AWS API request.
+  '''
+  return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+def is_transient(error):
+  '''
+  Returns True if the error is a connection error, timeout or server error that is retried in the standard
+  and adaptive retry modes.
+  '''
+  if isinstance(error, (ConnectionError, HTTPClientError)):
+    return True
+  if not isinstance(error, ClientError):
+    return False
+  return (error.response.get('Error', {}).get('Code') in TRANSIENT_ERRORS or
+    error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') in TRANSIENT_STATUS_CODES)
+
+def is_retryable(error):
+  return is_throttled(error) or (RETRY_MODE != 'legacy' and is_transient(error))
+
+def begin_invocation(context=None):
+  '''
+  Resets the throttling counters and records the remaining time function of the Lambda context (if any),
+  so that retries are not attempted once backing off would run past the end of the invocation.
+  '''
+  with LOCK:
+    STATS.clear()
+    REMAINING_TIME[0] = getattr(context, 'get_remaining_time_in_millis', None)
+
+def get_stats():
+  '''
+  Returns a copy of the call, throttle and retry counts per service operation for the current invocation.
+  '''
+  with LOCK:
+    return dict((k, dict(v)) for k, v in STATS.items())
+
+def count(key, stat):
+  with LOCK:
+    stats = STATS.setdefault(key, {'calls': 0, 'throttles': 0, 'errors': 0, 'retries': 0})
+    stats[stat] += 1
+
+def backoff_delay(attempt):
+  '''
+  Returns an exponential backoff delay with full jitter for the given retry attempt.
+  '''
+  return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+def can_retry(delay):
+  '''
+  Returns True if there is enough remaining execution time to back off for 'delay' seconds and retry.
+  '''
+  remaining_time = REMAINING_TIME[0]
+  return remaining_time is None or (delay + SAFETY_MARGIN) * 1000 < remaining_time()
+
+class TokenBucket(object):
+  """Allows bursts of up to 'burst' calls from any thread, refilled at 'rate' calls per second"""
+  def __init__(self, rate, burst):
+    self.rate = float(rate)
+    self.burst = burst
+    self.tokens = burst
+    self.updated = time.time()
+    self.lock = threading.Lock()
+
+  def refill(self, now):
+    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  # Takes a token, waiting for the bucket to refill if it is empty
+  def acquire(self):
+    with self.lock:
+      self.refill(time.time())
+      self.tokens -= 1
+      delay = -self.tokens / self.rate if self.tokens < 0 else 0
+    if delay > 0:
+      sleep(delay)
+
+  # Empties the bucket after a throttled request so that concurrent callers slow down together
+  def drain(self):
+    with self.lock:
+      self.refill(time.time())
+      self.tokens = min(self.tokens, 0)
+
+def get_bucket(key, rate, burst):
+  bucket = BUCKETS.get(key)
+  if bucket is None:
+    with LOCK:
+      bucket = BUCKETS.setdefault(key, TokenBucket(rate, burst))
+  return bucket
+
+class ThrottledClient(object):
+  """Wraps a boto3 client so that each API operation is rate limited and throttled (or transient) errors are retried"""
+  def __init__(self, client, service, rates=None):
+    self.client = client
+    self.service = service
+    self.rates = rates or {}
+
+  def __getattr__(self, operation):
+    return partial(self.call, operation)
+
+  def call(self, operation, *args, **kwargs):
+    '''
+    Calls the client operation once a token is available from the operation's bucket.
+    Throttled requests (and transient errors, unless CLIENT_RETRY_MODE is 'legacy') are retried with exponential
+    backoff and full jitter until MAX_ATTEMPTS is reached or backing off would exceed the remaining Lambda execution
+    time, in which case the error is raised.
+    '''
+    key = '%s:%s' % (self.service, operation)
+    bucket = get_bucket(key, self.rates.get(operation, API_RATE), API_BURST)
+    method = getattr(self.client, operation)
+    attempt = 0
+    while True:
+      bucket.acquire()
+      count(key, 'calls')
+      started = time.time()
+      try:
+        return method(*args, **kwargs)
+      except (ClientError, ConnectionError, HTTPClientError) as e:
+        if not is_retryable(e):
+          raise
+        if is_throttled(e):
+          count(key, 'throttles')
+          increment('api.Throttles')
+          bucket.drain()
+        else:
+          count(key, 'errors')
+          increment('api.TransientErrors')
+        delay = backoff_delay(attempt)
+        attempt += 1
+        if attempt >= MAX_ATTEMPTS or not can_retry(delay):
+          raise
+        count(key, 'retries')
+        increment('api.Retries')
+        sleep(delay)
+      finally:
+        record('api.' + key, time.time() - started)
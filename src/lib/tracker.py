@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from .ecs import EcsTaskExitCodeError
+from .snapshot import snapshot_tasks
+
+class TaskTracker(object):
+  """Tracks task status across checks, describing only tasks that have not yet stopped"""
+  def __init__(self, tasks, failures=None, detail=False, fail_fast=False):
+    self.tasks = OrderedDict((t.get('taskArn'), t) for t in tasks)
+    self.unfinished = [arn for arn, t in self.tasks.items() if t.get('lastStatus') != 'STOPPED']
+    self.failures = failures or []
+    self.detail = detail
+    self.fail_fast = fail_fast
+
+  def refresh(self, task_mgr, cluster):
+    '''
+    Describes the unfinished tasks and updates their status.
+    Returns the full describe result for the unfinished tasks.
+    '''
+    if not self.unfinished:
+      return {'tasks': [], 'failures': []}
+    result = task_mgr.describe_tasks(cluster=cluster, tasks=self.unfinished)
+    self.update(result)
+    return result
+
+  def update(self, result):
+    self.failures = result.get('failures', [])
+    described = result.get('tasks', [])
+    for t in snapshot_tasks(described, self.detail):
+      self.tasks[t.get('taskArn')] = t
+    stopped = [t for t in described if t.get('lastStatus') == 'STOPPED']
+    self.unfinished = [arn for arn in self.unfinished if self.tasks[arn].get('lastStatus') != 'STOPPED']
+    if self.fail_fast:
+      non_zero = [t.get('taskArn') for t in stopped for c in t.get('containers', []) if c.get('exitCode') != 0]
+      if non_zero:
+        raise EcsTaskExitCodeError(list(self.tasks.values()), non_zero)
+
+  @property
+  def status(self):
+    statuses = set(self.tasks[arn].get('lastStatus') for arn in self.unfinished)
+    if 'PENDING' in statuses:
+      return 'PENDING'
+    elif statuses:
+      return 'RUNNING'
+    return 'STOPPED'
+
+  def result(self):
+    return {'tasks': list(self.tasks.values()), 'failures': self.failures}
@@ -1,15 +1,98 @@
-def paginated_response(func, result_key, next_token=None):
+import re
+import time
+import calendar
+from itertools import islice, chain
+from datetime import datetime
+
+# Default upper bound on concurrent AWS API calls made from a single invocation
+MAX_WORKERS = 10
+
+# ISO 8601 timestamps as returned by boto3 or serialized via isoformat()
+ISO_TIMESTAMP = re.compile(r'^(\d{4}-\d\d-\d\d)[T ](\d\d:\d\d:\d\d)(\.\d+)?(Z|[+-]\d\d:?\d\d)?$')
+
+def paginate(func, result_key, max_items=None, token_key='NextToken'):
+  '''
+  Yields each item of a paginated operation, fetching the next page only once the current page is consumed.
+  The 'result_key' is used to define the items returned in each paginated response.
+  The 'token_key' is the name of the pagination token, which is 'nextToken' for ECS operations.
+  Iteration stops after 'max_items' items (if specified) without requesting further pages.
+  '''
+  if max_items is not None and max_items <= 0:
+    return
+  args = dict()
+  count = 0
+  while True:
+    response = func(**args)
+    for item in response.get(result_key) or []:
+      yield item
+      count += 1
+      if count == max_items:
+        return
+    next_token = response.get(token_key)
+    if not next_token:
+      return
+    args[token_key] = next_token
+
+def paginated_response(func, result_key, max_items=None, token_key='NextToken'):
   '''
   Returns expanded response for paginated operations.
   The 'result_key' is used to define the concatenated results that are combined from each paginated response.
   '''
-  args=dict()
-  if next_token:
-      args['NextToken'] = next_token
-  response = func(**args)
-  result = response.get(result_key)
-  next_token = response.get('NextToken')
-  if not next_token:
-    return result
-  return result + paginated_response(func, result_key, next_token)
-  
\ No newline at end of file
+  return list(paginate(func, result_key, max_items, token_key))
+
+def batches(iterable, size):
+  '''
+  Yields consecutive lists of at most 'size' items from an iterable as the items become available.
+  '''
+  batch = []
+  for item in iterable:
+    batch.append(item)
+    if len(batch) == size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+def chunks(items, size):
+  '''
+  Splits a list of items into consecutive lists of at most 'size' items.
+  '''
+  return [items[i:i + size] for i in range(0, len(items), size)]
+
+def concurrent_map(func, items, max_workers=MAX_WORKERS):
+  '''
+  Applies 'func' to each item using a bounded thread pool.
+  Each item is submitted as soon as it is produced, so items from a generator (e.g. pages of a paginated
+  operation) are processed while the generator continues.
+  Results are returned in the same order as the input items.  A single item is processed inline.
+  '''
+  items = iter(items)
+  head = list(islice(items, 2))
+  if len(head) <= 1:
+    return [func(i) for i in head]
+  from concurrent.futures import ThreadPoolExecutor
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = [executor.submit(func, i) for i in chain(head, items)]
+    return [f.result() for f in futures]
+
+def to_timestamp(value):
+  '''
+  Converts a datetime or ISO 8601 string to seconds since the epoch, treating naive values as UTC.
+  Returns None for missing or unrecognised values.
+  '''
+  if isinstance(value, datetime):
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+  if isinstance(value, (int, float)):
+    return value
+  match = ISO_TIMESTAMP.match(value or '')
+  if not match:
+    return None
+  date, clock, fraction, zone = match.groups()
+  timestamp = calendar.timegm(datetime.strptime(date + 'T' + clock, '%Y-%m-%dT%H:%M:%S').timetuple())
+  if fraction:
+    timestamp += float(fraction)
+  if zone and zone != 'Z':
+    sign = -1 if zone[0] == '-' else 1
+    zone = zone[1:].replace(':', '')
+    timestamp -= sign * (int(zone[:2]) * 3600 + int(zone[2:]) * 60)
+  return timestamp
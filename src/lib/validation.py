@@ -1,4 +1,13 @@
-from voluptuous import Required, All, Any, Range, Schema, Length
+from datetime import datetime
+from voluptuous import Required, Optional, All, Any, Range, Schema, Length
+from .metrics import timed
+from .utils import to_timestamp
+
+# Maximum number of tasks that can be run for a single request, started in batches of up to 10 tasks
+MAX_COUNT = 1000
+
+# Maximum number of task specs in a single batch request
+MAX_BATCH_SIZE = 50
 
 def ToInt(value):
   if isinstance(value, int):
@@ -18,20 +27,30 @@ def ToBool(value):
   else:
     raise ValueError
 
+# For datetimes or ISO 8601 timestamps, which are kept as is
+def Timestamp(value):
+  if isinstance(value, (basestring, datetime, int, float)) and to_timestamp(value) is not None:
+    return value
+  raise ValueError
+
 # For Overrides, which must specify all values as strings
+# Subtrees that already consist only of strings are returned as is rather than copied
 def DictToString(value):
   def string_values(node):
     if type(node) is dict:
-      result={}
-      for k,v in node.iteritems():
-        result[k] = string_values(v)
+      items = [(k, string_values(v)) for k,v in node.iteritems()]
+      if all(v is node[k] for k,v in items):
+        return node
+      return dict(items)
     elif type(node) is list:
-      result=[]
-      for v in node:
-        result.append(string_values(v))
+      items = [string_values(v) for v in node]
+      if all(v is n for v,n in zip(items, node)):
+        return node
+      return items
+    elif isinstance(node, basestring):
+      return node
     else:
-      result = str(node)
-    return result
+      return str(node)
   if isinstance(value, dict):
     return string_values(value)
   else:
@@ -42,17 +61,22 @@ def get_cfn_validator():
   return Schema({
   Required('Cluster'): Any(str, unicode),
   Required('TaskDefinition'): Any(str, unicode),
-  Required('Count', default=1): All(ToInt, Range(min=0, max=10)),
+  Required('Count', default=1): All(ToInt, Range(min=0, max=MAX_COUNT)),
   Required('RunOnUpdate', default=True): All(ToBool),
-  Required('UpdateCriteria', default=[]): All([Schema({
+  Required('UpdateCriteria', default=list): All([Schema({
     Required('Container'): Any(str, unicode),
     Required('EnvironmentKeys'): All(list)
   })]),
   Required('RunOnRollback', default=True): All(ToBool),
   Required('Timeout', default=290): All(ToInt, Range(min=0, max=3600)),
   Required('PollInterval', default=10): All(ToInt, Range(min=10, max=60)),
-  Required('Overrides', default=dict()): All(DictToString),
-  Required('Instances', default=list()): All(list, Length(max=10)),
+  Required('EventQueue', default=''): Any(str, unicode),
+  Required('Detail', default=False): All(ToBool),
+  Required('FailFast', default=False): All(ToBool),
+  Required('Overrides', default=dict): All(DictToString),
+  Required('Instances', default=list): All(list, Length(max=10)),
+  Required('Preflight', default='Off'): Any('Off', 'Reject', 'Wait'),
+  Required('Priority', default=0): All(ToInt),
 }, extra=True)
 
 # Validation Helper
@@ -60,22 +84,45 @@ def get_ecs_validator():
   return Schema({
   Required('Cluster'): Any(str, unicode),
   Required('TaskDefinition'): Any(str, unicode),
-  Required('Count', default=1): All(ToInt, Range(min=1, max=10)),
-  Required('Overrides', default=dict()): All(DictToString),
-  Required('Instances', default=list()): All(list, Length(max=10)),
-  Required('Tasks', default=list()): All(list),
+  Required('Count', default=1): All(ToInt, Range(min=1, max=MAX_COUNT)),
+  Required('Overrides', default=dict): All(DictToString),
+  Required('Instances', default=list): All(list, Length(max=10)),
+  Required('Tasks', default=list): All(list),
   Required('Status', default=''): Any(str, unicode),
   Required('StartedBy', default='admin'): Any(str, unicode),
   Required('Timeout', default=3600): All(ToInt, Range(min=60, max=604800)),
-  Required('Poll', default=10): All(ToInt, Range(min=10, max=3600))
+  Required('Poll', default=10): All(ToInt, Range(min=10, max=3600)),
+  Required('Detail', default=False): All(ToBool),
+  Required('FailFast', default=False): All(ToBool),
+  Required('Preflight', default='Off'): Any('Off', 'Reject', 'Wait'),
+  Required('Priority', default=0): All(ToInt),
+  Optional('LaunchId'): All(ToInt),
+  Optional('CreateTimestamp'): All(Timestamp)
 }, extra=True)
 
 # Validation Helper
+def get_batch_validator():
+  return Schema({
+  Required('Specs'): All([dict], Length(min=1, max=MAX_BATCH_SIZE)),
+  Required('Status', default=''): Any(str, unicode)
+}, extra=True)
+
+# Validators are compiled once and reused across invocations
+CFN_VALIDATOR = get_cfn_validator()
+ECS_VALIDATOR = get_ecs_validator()
+BATCH_VALIDATOR = get_batch_validator()
+
+# Validation Helper
+@timed('validate_ecs')
 def validate_ecs(data):
-  request_validator = get_ecs_validator()
-  return request_validator(data)
+  return ECS_VALIDATOR(data)
 
 # Validation Helper
+@timed('validate_cfn')
 def validate_cfn(data):
-  request_validator = get_cfn_validator()
-  return request_validator(data)
\ No newline at end of file
+  return CFN_VALIDATOR(data)
+
+# Validation Helper
+@timed('validate_batch')
+def validate_batch(data):
+  return BATCH_VALIDATOR(data)
\ No newline at end of file
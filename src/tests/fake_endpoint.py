@@ -0,0 +1,72 @@
+'''
+Local HTTP endpoint serving the ECS JSON API from the benchmark's fake ECS backend.
+Requests are handled on their own threads, so concurrent requests from a real boto3 client overlap
+just as they do against the real service.
+'''
+import re
+import json
+import calendar
+import threading
+from datetime import datetime
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from botocore.exceptions import ClientError
+import boto3
+
+# Converts an operation name (e.g. ListTasks) to the fake backend method name (e.g. list_tasks)
+def method_name(operation):
+  return re.sub(r'(?<!^)([A-Z])', r'_\1', operation).lower()
+
+# Serializes datetimes as epoch seconds, as the ECS JSON protocol does
+def default(value):
+  if isinstance(value, datetime):
+    return calendar.timegm(value.utctimetuple())
+  raise TypeError(repr(value))
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+class FakeEndpoint(object):
+  """Serves a fake backend over HTTP on a local port until stopped"""
+  def __init__(self, backend):
+    self.backend = backend
+    endpoint = self
+    class RequestHandler(BaseHTTPRequestHandler):
+      def do_POST(self):
+        operation = self.headers.get('X-Amz-Target', '').split('.')[-1]
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or '{}')
+        try:
+          status, response = 200, getattr(endpoint.backend, method_name(operation))(**body)
+        except ClientError as e:
+          status, response = 400, {'__type': e.response['Error']['Code'], 'message': e.response['Error']['Message']}
+        payload = json.dumps(response, default=default)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-amz-json-1.1')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+      def log_message(self, *args):
+        pass
+    self.server = ThreadingServer(('127.0.0.1', 0), RequestHandler)
+    self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+    self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+    self.thread.daemon = True
+
+  def start(self):
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  # Returns a real boto3 client for the endpoint
+  def client(self, service):
+    return boto3.session.Session().client(
+      service,
+      endpoint_url=self.url,
+      region_name='us-west-2',
+      aws_access_key_id='testing',
+      aws_secret_access_key='testing'
+    )
@@ -5,7 +5,10 @@ import mock
 import datetime
 from dateutil.tz import tzutc
 from uuid import uuid4
-from lib import EcsTaskManager, CfnManager
+from lib import EcsTaskManager, CfnManager, SqliteLaunchStore, set_launch_store
+from lib.ecs import TASK_DEFINITION_CACHE
+from lib.throttle import BUCKETS, begin_invocation
+from lib.cfn import STACK_STATUS_CACHE
 from constants import *
 
 # Patched create_task module
@@ -13,7 +16,7 @@ from constants import *
 def create_task():
   with mock.patch('boto3.client') as client:
     import create_task
-    client.run_task.return_value = START_TASK_RESULT
+    client.run_task.return_value = copy.deepcopy(START_TASK_RESULT)
     task_mgr = EcsTaskManager()
     task_mgr.client = client
     create_task.task_mgr = task_mgr
@@ -24,12 +27,24 @@ def create_task():
 def check_task():
   with mock.patch('boto3.client') as client:
     import check_task
-    client.describe_tasks.return_value = RUNNING_TASK_RESULT
+    client.describe_tasks.return_value = copy.deepcopy(RUNNING_TASK_RESULT)
     task_mgr = EcsTaskManager()
     task_mgr.client = client
     check_task.task_mgr = task_mgr
     yield check_task
 
+# Patched create_tasks module
+@pytest.fixture()
+def create_tasks(create_task):
+  import create_tasks
+  yield create_tasks
+
+# Patched check_tasks module
+@pytest.fixture()
+def check_tasks(check_task):
+  import check_tasks
+  yield check_tasks
+
 @pytest.fixture
 def create_task_event():
   return {
@@ -77,6 +92,14 @@ def now(time):
   with mock.patch('time.time', return_value=NOW) as now:
     yield now
 
+# Launch queue held in a temporary SQLite database
+@pytest.fixture
+def launch_store(tmpdir):
+  store = SqliteLaunchStore(str(tmpdir.join('launches.db')))
+  previous = set_launch_store(store)
+  yield store
+  set_launch_store(previous)
+
 # Patched ECS task manager
 @pytest.fixture
 def task_mgr():
@@ -84,6 +107,9 @@ def task_mgr():
     client.run_task.return_value = START_TASK_RESULT
     client.describe_tasks.return_value = STOPPED_TASK_RESULT
     client.describe_task_definition.side_effect = lambda taskDefinition: TASK_DEFINITION_RESULTS[taskDefinition]
+    TASK_DEFINITION_CACHE.clear()
+    BUCKETS.clear()
+    begin_invocation()
     task_mgr = EcsTaskManager()
     task_mgr.client = client
     yield task_mgr
@@ -93,6 +119,7 @@ def task_mgr():
 def cfn_mgr():
   with mock.patch('boto3.client') as client:
     cfn_mgr = CfnManager()
+    STACK_STATUS_CACHE.clear()
     client.describe_stacks.side_effect = lambda StackName: DESCRIBE_STACKS_RESULT
     cfn_mgr.client = client
     yield cfn_mgr
@@ -107,6 +134,8 @@ def ecs_tasks():
     client.describe_task_definition.side_effect = lambda taskDefinition: TASK_DEFINITION_RESULTS[taskDefinition]
     client.list_tasks.side_effect = [LIST_TASKS_RESULT]
     client.stop_task.side_effect = [STOPPED_TASK_RESULT]
+    TASK_DEFINITION_CACHE.clear()
+    BUCKETS.clear()
     task_mgr = EcsTaskManager()
     task_mgr.client = client
     ecs_tasks.task_mgr = task_mgr
@@ -190,7 +219,7 @@ def required_property(request):
     'Count','RunOnUpdate','RunOnRollback','Timeout','PollInterval','Instances','Overrides'
   ], 
   params=[
-    ('Count','50'),               # Maximum count = 10
+    ('Count','5000'),             # Maximum count = 1000
     ('RunOnUpdate','never'),      # RunOnUpdate is a boolean
     ('RunOnRollback', 'always'),  # RunOnRollback is a boolean
     ('Timeout','4000'),           # Maximum timeout = 3600
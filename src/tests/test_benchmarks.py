@@ -0,0 +1,15 @@
+from benchmarks import bench_handlers
+
+# Test every handler scenario completes against the fake backends, including re-invocations of the poll handler
+def test_handler_scenarios_complete():
+  results = bench_handlers.main(['--resources', '2', '--count', '12', '--latency', '0', '--lambda-timeout', '60', '--json'])
+  assert [r['scenario'] for r in results] == [name for name, _ in bench_handlers.SCENARIOS]
+  invocations = dict((r['scenario'], r['invocations']) for r in results)
+  assert invocations['cfn create'] > 2 and invocations['cfn update'] > 2
+  assert invocations['cfn delete'] == 2
+  assert all(r['api_calls'] > 0 and r['max_payload'] > 0 for r in results)
+
+# Test every task is stopped on delete when the tasks span several list pages
+def test_delete_stops_every_page_of_tasks():
+  results = bench_handlers.main(['--resources', '1', '--count', '250', '--latency', '0', '--rate', '0', '--scenario', 'cfn delete', '--json'])
+  assert results[0]['invocations'] == 1
@@ -0,0 +1,99 @@
+import pytest
+import fixtures
+from fixtures import task_mgr, ecs_tasks, create_task, create_task_event, create_event, context, time, now, launch_store
+from lib.capacity import task_requirements, shortfall
+from lib.ecs import CLUSTER_CAPACITY_CACHE, CONTAINER_INSTANCE_CACHE
+
+INSTANCE_ARN = 'arn:aws:ecs:us-west-2:123456789012:container-instance/%s'
+
+# Returns a container instance description with the given registered and remaining CPU and memory
+def container_instance(index, registered, remaining, status='ACTIVE'):
+  resources = lambda cpu, memory: [{'name': 'CPU', 'integerValue': cpu}, {'name': 'MEMORY', 'integerValue': memory}]
+  return {
+    'containerInstanceArn': INSTANCE_ARN % index,
+    'ec2InstanceId': 'i-%08d' % index,
+    'status': status,
+    'agentConnected': True,
+    'registeredResources': resources(*registered),
+    'remainingResources': resources(*remaining)
+  }
+
+# Configures the ECS client mock to list and describe the given container instances
+def use_instances(client, instances):
+  CLUSTER_CAPACITY_CACHE.clear()
+  CONTAINER_INSTANCE_CACHE.clear()
+  client.list_container_instances.return_value = {'containerInstanceArns': [i['containerInstanceArn'] for i in instances]}
+  client.describe_container_instances.return_value = {'containerInstances': instances}
+
+def test_task_requirements_add_up_container_reservations():
+  definition = {'containerDefinitions': [{'name': 'app', 'cpu': 256, 'memory': 512}, {'name': 'proxy', 'memoryReservation': 128}]}
+  assert task_requirements(definition) == (256, 640)
+  assert task_requirements(definition, {'containerOverrides': [{'name': 'app', 'cpu': '512'}]}) == (512, 640)
+  assert task_requirements(dict(definition, cpu='1024', memory='2048')) == (1024, 2048)
+
+def test_shortfall_reports_the_exhausted_resource():
+  capacity = [{'registered': (1024, 2048), 'remaining': (1024, 300)}, {'registered': (1024, 2048), 'remaining': (1024, 300)}]
+  assert shortfall(capacity, (256, 100), 6) == ([], True)
+  failures, retryable = shortfall(capacity, (256, 100), 7)
+  assert [f['reason'] for f in failures] == ['RESOURCE:MEMORY']
+  assert retryable
+  failures, retryable = shortfall(capacity, (2048, 100), 1)
+  assert [f['reason'] for f in failures] == ['RESOURCE:CPU,MEMORY']
+  assert not retryable
+
+def test_cluster_capacity_is_cached(task_mgr, time):
+  use_instances(task_mgr.client, [container_instance(0, (1024, 1024), (512, 512)), container_instance(1, (1024, 1024), (1024, 1024), 'DRAINING')])
+  assert [c['remaining'] for c in task_mgr.get_cluster_capacity(fixtures.CLUSTER_NAME)] == [(512, 512)]
+  task_mgr.get_cluster_capacity(fixtures.CLUSTER_NAME)
+  assert task_mgr.client.describe_container_instances.call_count == 1
+  task_mgr.get_cluster_capacity(fixtures.CLUSTER_NAME, cached=False)
+  assert task_mgr.client.describe_container_instances.call_count == 2
+
+def test_check_capacity_of_instances(task_mgr, time):
+  use_instances(task_mgr.client, [container_instance(0, (1024, 1024), (0, 1024)), container_instance(1, (1024, 1024), (1024, 1024))])
+  failures, retryable = task_mgr.check_capacity(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 2, ['i-00000000', 'i-00000001'])
+  assert failures == []
+  task_mgr.client.describe_task_definition.side_effect = lambda taskDefinition: {'taskDefinition': {'containerDefinitions': [{'name': 'app', 'cpu': 10, 'memory': 10}]}}
+  failures, retryable = task_mgr.check_capacity(fixtures.CLUSTER_NAME, 'family', {}, 2, ['i-00000000', 'i-00000001'])
+  assert [(f['arn'], f['reason']) for f in failures] == [(INSTANCE_ARN % 0, 'RESOURCE:CPU')]
+  assert retryable
+
+def test_starting_tasks_invalidates_cached_capacity(task_mgr, time):
+  use_instances(task_mgr.client, [container_instance(0, (1024, 1024), (1024, 1024))])
+  task_mgr.get_cluster_capacity(fixtures.CLUSTER_NAME)
+  task_mgr.start_task(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 1, 'admin', [])
+  task_mgr.get_cluster_capacity(fixtures.CLUSTER_NAME)
+  assert task_mgr.client.describe_container_instances.call_count == 2
+
+def test_create_task_rejects_tasks_without_capacity(create_task, create_task_event, context):
+  client = create_task.task_mgr.client
+  client.describe_task_definition.side_effect = lambda taskDefinition: fixtures.TASK_DEFINITION_RESULTS[taskDefinition]
+  use_instances(client, [container_instance(0, (1024, 1024), (1024, 50))])
+  create_task_event['Preflight'] = 'Reject'
+  result = create_task.handler(create_task_event, context)
+  assert result['Status'] == 'FAILED'
+  assert 'RESOURCE:MEMORY' in result['Reason']
+  assert not client.run_task.called
+
+def test_preflight_waits_for_capacity(ecs_tasks, create_event, context, time, launch_store):
+  client = ecs_tasks.task_mgr.client
+  use_instances(client, [container_instance(0, (1024, 1024), (1024, 50))])
+  client.describe_container_instances.side_effect = [
+    {'containerInstances': [container_instance(0, (1024, 1024), (1024, 50))]},
+    {'containerInstances': [container_instance(0, (1024, 1024), (1024, 1024))]}
+  ]
+  create_event['ResourceProperties']['Preflight'] = 'Wait'
+  response = ecs_tasks.handle_create(create_event, context)
+  assert response['Status'] == 'SUCCESS'
+  assert client.describe_container_instances.call_count == 2
+  assert client.run_task.call_count == 1
+
+def test_preflight_rejects_tasks_that_never_fit(ecs_tasks, create_event, context, time, launch_store):
+  client = ecs_tasks.task_mgr.client
+  use_instances(client, [container_instance(0, (1024, 50), (1024, 50))])
+  create_event['ResourceProperties']['Preflight'] = 'Wait'
+  response = ecs_tasks.handle_create(create_event, context)
+  assert response['Status'] == 'FAILED'
+  assert 'registered' in response['Reason']
+  assert not time.called
+  assert not client.run_task.called
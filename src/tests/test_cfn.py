@@ -1,14 +1,18 @@
 import pytest
+import copy
 import fixtures
 from fixtures import context, ecs_tasks, handlers, create_update_handlers, time, now, cfn_mgr
 from fixtures import create_event, update_event, delete_event
 from fixtures import required_property, invalid_property
 from cfn_lambda_handler import CfnLambdaExecutionTimeout
+from lib import snapshot_result, load_checkpoint
+from lib.checkpoint import CHECKPOINT_VERSION
+from lib.formatting import json_native
 
 # Test poll request completes successfully
 def test_poll_task_completes(ecs_tasks, create_event, context, time):
-  # The 10000 value will trigger a CfnLambdaExecutionTimeout event
-  context.get_remaining_time_in_millis.side_effect = [20000,10000,20000,20000]
+  # The 6000 value will trigger a CfnLambdaExecutionTimeout event
+  context.get_remaining_time_in_millis.side_effect = [20000,6000,20000,20000]
   # The ECS task will be running on first poll and will complete on second poll
   ecs_tasks.task_mgr.client.describe_tasks.side_effect = [fixtures.RUNNING_TASK_RESULT,fixtures.STOPPED_TASK_RESULT]
   # Simulated create event
@@ -17,7 +21,7 @@ def test_poll_task_completes(ecs_tasks, create_event, context, time):
   # Simulated poll event
   poll_event = create_event
   poll_event['EventState'] = e.value.state
-  assert poll_event['EventState']['TaskResult'] == fixtures.RUNNING_TASK_RESULT
+  assert load_checkpoint(poll_event['EventState'])['TaskResult']['tasks'][0]['lastStatus'] == 'RUNNING'
   # Process the poll request during which the task will complete
   response = ecs_tasks.handle_poll(poll_event, context)
   assert ecs_tasks.task_mgr.client.run_task.call_count == 1
@@ -28,7 +32,7 @@ def test_poll_task_completes(ecs_tasks, create_event, context, time):
 # Test poll request fails after maximum timeout 
 def test_poll_task_timeout(ecs_tasks, create_event, context, time, now):
   create_event['ResourceProperties']['Timeout'] = 3600
-  context.get_remaining_time_in_millis.side_effect = [20000,10000]
+  context.get_remaining_time_in_millis.side_effect = [20000,6000]
   ecs_tasks.task_mgr.client.describe_tasks.side_effect = lambda cluster,tasks: fixtures.RUNNING_TASK_RESULT
   # Simulated create event
   with pytest.raises(CfnLambdaExecutionTimeout) as e:
@@ -41,7 +45,7 @@ def test_poll_task_timeout(ecs_tasks, create_event, context, time, now):
     # Fast forward 60 seconds
     now.return_value += 60
     # Let the handler check task status once and then run out of execution time
-    context.get_remaining_time_in_millis.side_effect = [20000,10000]
+    context.get_remaining_time_in_millis.side_effect = [20000,6000]
     try:
       # Process the poll request - the task will never complete
       response = ecs_tasks.handle_poll(poll_event, context)
@@ -57,22 +61,21 @@ def test_poll_task_timeout(ecs_tasks, create_event, context, time, now):
 
 # Test delete request when task is already stopped 
 def test_delete_task_stopped(ecs_tasks, delete_event, context, time):
-  ecs_tasks.task_mgr.client.list_tasks.side_effect = [{'taskArns':[]}]
   response = ecs_tasks.handle_delete(delete_event, context)
   assert not ecs_tasks.task_mgr.client.run_task.called
-  assert not ecs_tasks.task_mgr.client.describe_tasks.called
-  assert ecs_tasks.task_mgr.client.list_tasks.called
+  assert ecs_tasks.task_mgr.client.describe_tasks.call_args[1]['tasks'] == [fixtures.PHYSICAL_RESOURCE_ID]
+  assert not ecs_tasks.task_mgr.client.list_tasks.called
   assert not ecs_tasks.task_mgr.client.stop_task.called
   assert response['Status'] == 'SUCCESS'
   assert response['PhysicalResourceId'] == fixtures.PHYSICAL_RESOURCE_ID
 
-# Test running task is stopped on delete
+# Test running task is stopped on delete without listing tasks
 def test_running_task_is_stopped_on_delete(ecs_tasks, delete_event, context, time):
+  ecs_tasks.task_mgr.client.describe_tasks.return_value = fixtures.RUNNING_TASK_RESULT
   response = ecs_tasks.handle_delete(delete_event, context)
   assert not ecs_tasks.task_mgr.client.run_task.called
-  assert not ecs_tasks.task_mgr.client.describe_tasks.called
-  assert ecs_tasks.task_mgr.client.list_tasks.called
-  assert ecs_tasks.task_mgr.client.stop_task.called
+  assert not ecs_tasks.task_mgr.client.list_tasks.called
+  assert ecs_tasks.task_mgr.client.stop_task.call_args[1]['task'] == fixtures.PHYSICAL_RESOURCE_ID
   assert response['Status'] == 'SUCCESS'
   assert response['PhysicalResourceId'] == fixtures.PHYSICAL_RESOURCE_ID
 
@@ -87,6 +90,19 @@ def test_no_run_when_run_on_rollback_disabled(ecs_tasks, cfn_mgr, update_event,
   assert response['Status'] == 'SUCCESS'
   assert response['PhysicalResourceId'] == fixtures.PHYSICAL_RESOURCE_ID
 
+# Test stack status is looked up once across updates and not looked up when provided with the event
+def test_stack_status_lookups_are_cached(ecs_tasks, cfn_mgr, update_event, context, time):
+  ecs_tasks.cfn_mgr = cfn_mgr
+  update_event['ResourceProperties']['RunOnRollback'] = u'False'
+  ecs_tasks.handle_update(copy.deepcopy(update_event), context)
+  ecs_tasks.handle_update(copy.deepcopy(update_event), context)
+  assert cfn_mgr.client.describe_stacks.call_count == 1
+  update_event['StackStatus'] = 'UPDATE_IN_PROGRESS'
+  update_event['StackId'] = 'other-stack'
+  ecs_tasks.handle_update(update_event, context)
+  assert cfn_mgr.client.describe_stacks.call_count == 1
+  assert ecs_tasks.task_mgr.client.run_task.called
+
 # Test task is run when UpdateCriteria is met
 def test_run_when_update_criteria_met(ecs_tasks, cfn_mgr, update_event, context, time):
   ecs_tasks.cfn_mgr = cfn_mgr
@@ -104,12 +120,23 @@ def test_no_run_when_update_criteria_not_met(ecs_tasks, cfn_mgr, update_event, c
   ecs_tasks.cfn_mgr = cfn_mgr
   update_event['ResourceProperties']['UpdateCriteria'] = fixtures.UPDATE_CRITERIA
   response = ecs_tasks.handle_update(update_event, context)
-  assert ecs_tasks.task_mgr.client.describe_task_definition.called
+  assert not ecs_tasks.task_mgr.client.describe_task_definition.called
   assert not ecs_tasks.task_mgr.client.run_task.called
   assert not ecs_tasks.task_mgr.client.describe_tasks.called
   assert response['Status'] == 'SUCCESS'
   assert response['PhysicalResourceId'] == fixtures.PHYSICAL_RESOURCE_ID
 
+# Test task definitions are looked up once per revision across updates
+def test_task_definition_lookups_are_cached(ecs_tasks, cfn_mgr, update_event, context, time):
+  ecs_tasks.cfn_mgr = cfn_mgr
+  update_event['ResourceProperties']['UpdateCriteria'] = fixtures.UPDATE_CRITERIA
+  update_event['ResourceProperties']['TaskDefinition'] = fixtures.NEW_TASK_DEFINITION_ARN
+  ecs_tasks.handle_update(copy.deepcopy(update_event), context)
+  response = ecs_tasks.handle_update(copy.deepcopy(update_event), context)
+  assert ecs_tasks.task_mgr.client.describe_task_definition.call_count == 2
+  assert ecs_tasks.task_mgr.client.run_task.call_count == 2
+  assert response['Status'] == 'SUCCESS'
+
 # Test task is not run when RunOnUpdate is false
 def test_no_run_when_run_on_update_disabled(ecs_tasks, update_event, context, time):
   update_event['ResourceProperties']['RunOnUpdate'] = u'False'
@@ -171,7 +198,11 @@ def test_run_task_execution_timeout(ecs_tasks, create_update_handlers, context,
     response = handler(event, context)
     assert ecs_tasks.task_mgr.client.run_task.called
     assert not ecs_tasks.task_mgr.client.describe_tasks.called
-  assert e.value.state['TaskResult'] == fixtures.START_TASK_RESULT
+  assert e.value.state['Version'] == CHECKPOINT_VERSION
+  assert e.value.state['Tasks']['Statuses'] == ['PENDING']
+  assert load_checkpoint(e.value.state)['TaskResult'] == {
+    'tasks': [{'taskArn': fixtures.PHYSICAL_RESOURCE_ID, 'lastStatus': 'PENDING', 'containers': []}], 'failures': []
+  }
 
 # Test for ECS task that does not complete within absolute task timeout
 def test_create_new_task_completion_timeout(ecs_tasks, create_update_handlers, context, time, now):
@@ -208,3 +239,113 @@ def test_invalid_property(ecs_tasks, handlers, invalid_property, context, time):
   assert 'One or more invalid event properties' in response['Reason']
   assert ecs_tasks.task_mgr.client.run_task.was_not_called
   assert ecs_tasks.task_mgr.client.describe_tasks.was_not_called
+
+# Test poll wakes on a task state change event instead of sleeping for the poll interval
+def test_poll_wakes_on_task_stopped_event(ecs_tasks, create_event, context, time):
+  create_event['ResourceProperties']['EventQueue'] = 'memory://task-events'
+  queue = ecs_tasks.get_event_queue('memory://task-events')
+  queue.put({'detail-type': 'ECS Task State Change', 'detail': {'taskArn': fixtures.PHYSICAL_RESOURCE_ID, 'lastStatus': 'STOPPED'}})
+  response = ecs_tasks.handle_create(create_event, context)
+  assert not time.called
+  assert ecs_tasks.task_mgr.client.describe_tasks.call_count == 1
+  assert response['Status'] == 'SUCCESS'
+  assert response['PhysicalResourceId'] == fixtures.PHYSICAL_RESOURCE_ID
+
+# Test poll falls back to describing tasks when no task state change events arrive
+def test_poll_falls_back_without_events(ecs_tasks, create_event, context, time, tmpdir):
+  create_event['ResourceProperties']['EventQueue'] = 'file://%s' % tmpdir.join('events.json')
+  ecs_tasks.task_mgr.client.describe_tasks.side_effect = [fixtures.RUNNING_TASK_RESULT,fixtures.STOPPED_TASK_RESULT]
+  response = ecs_tasks.handle_create(create_event, context)
+  assert time.called
+  assert ecs_tasks.task_mgr.client.describe_tasks.call_count == 2
+  assert response['Status'] == 'SUCCESS'
+
+# Test tasks are stopped page by page on delete
+def test_all_task_pages_are_stopped_on_delete(ecs_tasks, delete_event, context, time):
+  task_arns = ['%s-%s' % (fixtures.PHYSICAL_RESOURCE_ID, i) for i in range(250)]
+  ecs_tasks.task_mgr.client.list_tasks.side_effect = [
+    {'taskArns': task_arns[:100], 'nextToken': '1'},
+    {'taskArns': task_arns[100:200], 'nextToken': '2'},
+    {'taskArns': task_arns[200:]}
+  ]
+  ecs_tasks.task_mgr.client.stop_task.side_effect = lambda cluster, task, reason: {'task': {'taskArn': task}}
+  delete_event['ResourceProperties']['Count'] = '250'
+  response = ecs_tasks.handle_delete(delete_event, context)
+  stopped = [c[1]['task'] for c in ecs_tasks.task_mgr.client.stop_task.call_args_list]
+  assert sorted(stopped) == sorted(task_arns)
+  assert response['Status'] == 'SUCCESS'
+
+# Test full task detail is kept in the poll state when requested
+def test_run_task_execution_timeout_with_detail(ecs_tasks, create_event, context, time):
+  context.get_remaining_time_in_millis.return_value = 1000
+  create_event['ResourceProperties']['Detail'] = 'true'
+  with pytest.raises(CfnLambdaExecutionTimeout) as e:
+    ecs_tasks.handle_create(create_event, context)
+  assert load_checkpoint(e.value.state)['TaskResult'] == json_native(fixtures.START_TASK_RESULT)
+
+# Returns a task result with tasks in the given statuses and container exit codes
+def task_result(*tasks):
+  return {
+    'tasks': [{'taskArn': arn, 'lastStatus': status, 'containers': [{'name': 'app', 'exitCode': code}]} for arn, status, code in tasks],
+    'failures': []
+  }
+
+# Test only tasks that have not yet stopped are described on each poll
+def test_poll_describes_unfinished_tasks(ecs_tasks, create_event, context, time):
+  ecs_tasks.task_mgr.client.run_task.return_value = task_result(('a', 'PENDING', None), ('b', 'PENDING', None))
+  ecs_tasks.task_mgr.client.describe_tasks.side_effect = [
+    task_result(('a', 'STOPPED', 0), ('b', 'RUNNING', None)),
+    task_result(('b', 'STOPPED', 0))
+  ]
+  response = ecs_tasks.handle_create(create_event, context)
+  described = [c[1]['tasks'] for c in ecs_tasks.task_mgr.client.describe_tasks.call_args_list]
+  assert described == [['a', 'b'], ['b']]
+  assert response['Status'] == 'SUCCESS'
+  assert response['PhysicalResourceId'] == 'a'
+
+# Test polling stops on the first non-zero exit code when FailFast is set
+def test_poll_fails_fast(ecs_tasks, create_event, context, time):
+  create_event['ResourceProperties']['FailFast'] = 'true'
+  ecs_tasks.task_mgr.client.run_task.return_value = task_result(('a', 'PENDING', None), ('b', 'PENDING', None))
+  ecs_tasks.task_mgr.client.describe_tasks.side_effect = [task_result(('a', 'STOPPED', 1), ('b', 'RUNNING', None))]
+  response = ecs_tasks.handle_create(create_event, context)
+  assert ecs_tasks.task_mgr.client.describe_tasks.call_count == 1
+  assert response['Status'] == 'FAILED'
+  assert 'One or more containers failed with a non-zero exit code' in response['Reason']
+
+# Test polling waits for all tasks when FailFast is 'false', as CloudFormation passes booleans as strings
+def test_poll_does_not_fail_fast_when_disabled(ecs_tasks, create_event, context, time):
+  create_event['ResourceProperties']['FailFast'] = 'false'
+  ecs_tasks.task_mgr.client.run_task.return_value = task_result(('a', 'PENDING', None), ('b', 'PENDING', None))
+  ecs_tasks.task_mgr.client.describe_tasks.side_effect = [
+    task_result(('a', 'STOPPED', 1), ('b', 'RUNNING', None)),
+    task_result(('b', 'STOPPED', 0))
+  ]
+  response = ecs_tasks.handle_create(create_event, context)
+  assert ecs_tasks.task_mgr.client.describe_tasks.call_count == 2
+  assert response['Status'] == 'FAILED'
+
+# Test tasks are listed by their started by ID on delete when the physical resource ID is not a task ARN
+def test_tasks_are_listed_on_delete_without_task_arn(ecs_tasks, delete_event, context, time):
+  delete_event['PhysicalResourceId'] = 'a6cd5b8a1d0a2bcf15d0c0c7c31a9b8e'
+  response = ecs_tasks.handle_delete(delete_event, context)
+  assert ecs_tasks.task_mgr.client.list_tasks.call_args[1]['startedBy'] == ecs_tasks.get_task_id(fixtures.STACK_ID, fixtures.LOGICAL_RESOURCE_ID)
+  assert ecs_tasks.task_mgr.client.stop_task.called
+  assert response['Status'] == 'SUCCESS'
+
+# Test tasks are listed by their started by ID on delete when a task was launched on each of several instances
+def test_tasks_are_listed_on_delete_with_instances(ecs_tasks, delete_event, context, time):
+  delete_event['ResourceProperties']['Instances'] = ['i-1', 'i-2']
+  ecs_tasks.task_mgr.client.list_tasks.side_effect = [{'taskArns': [fixtures.PHYSICAL_RESOURCE_ID, 'other']}]
+  ecs_tasks.task_mgr.client.stop_task.side_effect = lambda cluster, task, reason: {'task': {'taskArn': task}}
+  response = ecs_tasks.handle_delete(delete_event, context)
+  assert not ecs_tasks.task_mgr.client.describe_tasks.called
+  stopped = sorted(c[1]['task'] for c in ecs_tasks.task_mgr.client.stop_task.call_args_list)
+  assert stopped == sorted([fixtures.PHYSICAL_RESOURCE_ID, 'other'])
+  assert response['Status'] == 'SUCCESS'
+
+# Test the launched task ARNs are returned as response data
+def test_task_arns_are_returned_as_data(ecs_tasks, create_event, context, time):
+  response = ecs_tasks.handle_create(create_event, context)
+  assert response['PhysicalResourceId'] == fixtures.PHYSICAL_RESOURCE_ID
+  assert response['Data'] == {'TaskArns': fixtures.PHYSICAL_RESOURCE_ID}
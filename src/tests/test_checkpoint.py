@@ -0,0 +1,55 @@
+import json
+import pytest
+import fixtures
+from fixtures import ecs_tasks, create_event, context, time, now
+from cfn_lambda_handler import CfnLambdaExecutionTimeout
+from lib import save_checkpoint, load_checkpoint
+from lib.throttle import begin_invocation
+
+TASK_ARNS = ['arn:aws:ecs:us-west-2:123456789012:task/cluster/%032x' % i for i in range(1000)]
+
+# Returns a polling task with the given tasks, where every tenth task has stopped
+def polling_task(arns):
+  tasks = [{'taskArn': arn, 'lastStatus': 'RUNNING', 'containers': [{'name': 'app'}]} for arn in arns]
+  for t in tasks[::10]:
+    t.update(lastStatus='STOPPED', stoppedReason='Essential container in task exited', containers=[{'name': 'app', 'exitCode': 0}])
+  return {
+    'Cluster': 'cluster', 'Timeout': 3600, 'CreationTime': fixtures.NOW, 'PollInterval': 10, 'EventQueue': '',
+    'Detail': False, 'FailFast': False, 'PollAttempt': 3, 'NextCheck': fixtures.NOW + 10, 'StartedBy': 'admin',
+    'TaskResult': {'tasks': tasks, 'failures': []}
+  }
+
+def test_checkpoint_round_trip():
+  begin_invocation()
+  task = polling_task(TASK_ARNS)
+  checkpoint = json.loads(json.dumps(save_checkpoint(task)))
+  assert checkpoint['Tasks']['Prefix'] == 'arn:aws:ecs:us-west-2:123456789012:task/cluster/'
+  assert len(json.dumps(checkpoint)) < 64 * 1024
+  resumed = load_checkpoint(checkpoint)
+  assert [t['taskArn'] for t in resumed['TaskResult']['tasks']] == TASK_ARNS
+  assert resumed['TaskResult']['tasks'][0] == task['TaskResult']['tasks'][0]
+  assert resumed['TaskResult']['tasks'][1] == {'taskArn': TASK_ARNS[1], 'lastStatus': 'RUNNING', 'containers': []}
+  assert resumed['PollAttempt'] == 3 and resumed['NextCheck'] == fixtures.NOW + 10
+  assert resumed['Budget'] == {'Invocations': 1, 'ApiCalls': 0}
+  assert 'StartedBy' not in resumed
+
+def test_load_checkpoint_accepts_unversioned_state():
+  task = polling_task(TASK_ARNS[:1])
+  assert load_checkpoint(task) is task
+  with pytest.raises(ValueError):
+    load_checkpoint({'Version': 99})
+
+# Test a resumed poll waits for the check scheduled by the previous invocation before describing tasks
+def test_resumed_poll_waits_for_scheduled_check(ecs_tasks, create_event, context, time, now):
+  context.get_remaining_time_in_millis.return_value = 1000
+  ecs_tasks.task_mgr.client.describe_tasks.side_effect = [fixtures.STOPPED_TASK_RESULT]
+  with pytest.raises(CfnLambdaExecutionTimeout) as e:
+    ecs_tasks.handle_create(create_event, context)
+  next_check = e.value.state['Poll']['NextCheck']
+  assert next_check > fixtures.NOW
+  now.return_value += 1
+  context.get_remaining_time_in_millis.return_value = 300000
+  response = ecs_tasks.handle_poll({'EventState': e.value.state}, context)
+  assert response['Status'] == 'SUCCESS'
+  assert time.call_args[0][0] == pytest.approx(next_check - now.return_value)
+  assert ecs_tasks.task_mgr.client.describe_tasks.call_count == 1
@@ -0,0 +1,72 @@
+import mock
+import pytest
+import threading
+from lib import clients, EcsTaskManager, CfnManager
+from lib.clients import get_client, get_pool_stats
+from fake_endpoint import FakeEndpoint
+from benchmarks.fake_aws import Clock, FakeEcs
+
+@pytest.fixture
+def registry():
+  with mock.patch.dict(clients.CLIENTS, clear=True), mock.patch.object(clients, 'SESSION', [None]), \
+      mock.patch('boto3.session.Session') as session:
+    yield session.return_value.client
+
+def test_managers_create_clients_on_first_use(registry):
+  task_mgr = EcsTaskManager()
+  cfn_mgr = CfnManager()
+  assert not registry.called
+  registry.return_value.list_tasks.return_value = {'taskArns': []}
+  task_mgr.list_tasks(cluster='cluster')
+  registry.assert_called_once_with('ecs', config=clients.CLIENT_CONFIG)
+
+def test_clients_are_shared_between_managers(registry):
+  registry.side_effect = lambda service, config: mock.Mock(service=service)
+  assert EcsTaskManager().client is EcsTaskManager().client
+  assert CfnManager().client is not EcsTaskManager().client
+  assert registry.call_count == 2
+
+def test_clients_share_one_session(registry):
+  get_client('ecs')
+  get_client('cloudformation')
+  assert clients.SESSION[0].client is registry
+  assert [c[0][0] for c in registry.call_args_list] == ['ecs', 'cloudformation']
+
+def test_client_config():
+  config = clients.CLIENT_CONFIG
+  assert config.max_pool_connections == clients.MAX_POOL_CONNECTIONS
+  assert (config.connect_timeout, config.read_timeout) == (clients.CONNECT_TIMEOUT, clients.READ_TIMEOUT)
+  assert config.retries == {'mode': 'standard', 'total_max_attempts': 1}
+
+# Blocks each request until 'count' requests are in flight, or 5 seconds have passed
+class BlockingEcs(FakeEcs):
+  def __init__(self, count, *args, **kwargs):
+    super(BlockingEcs, self).__init__(*args, **kwargs)
+    self.barrier = threading.Semaphore(0)
+    self.count = count
+    self.arrived = 0
+
+  def request(self, operation):
+    with self.lock:
+      self.arrived += 1
+      release = self.arrived == self.count
+    if release:
+      for _ in range(self.count):
+        self.barrier.release()
+    self.barrier.acquire()
+    super(BlockingEcs, self).request(operation)
+
+def test_pool_saturation_is_counted():
+  endpoint = FakeEndpoint(BlockingEcs(3, Clock(), instances=1, latency=0, rate=0)).start()
+  try:
+    with mock.patch.dict(clients.POOL_STATS, clear=True), mock.patch.object(clients, 'MAX_POOL_CONNECTIONS', 2):
+      client = endpoint.client('ecs')
+      clients.track_pool(client, 'ecs')
+      threads = [threading.Thread(target=client.list_container_instances, kwargs={'cluster': 'c'}) for _ in range(3)]
+      for t in threads:
+        t.start()
+      for t in threads:
+        t.join(10)
+      assert get_pool_stats() == {'ecs': {'in_flight': 0, 'peak': 3, 'saturated': 1}}
+  finally:
+    endpoint.stop()
@@ -6,6 +6,8 @@ from fixtures import check_task
 from fixtures import check_task_event
 from fixtures import create_task
 from fixtures import create_task_event
+from fixtures import create_tasks
+from fixtures import check_tasks
 from dateutil.parser import parse
 
 def test_create_task_created(create_task, create_task_event, context):
@@ -41,6 +43,14 @@ def test_check_task_timeout(check_task, check_task_event, context):
   assert result['Status'] == 'FAILED'
   assert result['Reason'].startswith('The task failed to complete with the specified timeout')
 
+def test_check_task_invalid_create_timestamp(check_task, check_task_event, context):
+  check_task_event['CreateTimestamp'] = 'yesterday'
+  result = check_task.handler(check_task_event, context)
+  assert not check_task.task_mgr.client.describe_tasks.called
+  assert result['Status'] == 'FAILED'
+  assert result['Reason'].startswith('One or more invalid event properties')
+  assert 'CreateTimestamp' in result['Reason']
+
 def test_check_task_exited_non_zero(check_task, check_task_event, context):
   check_task.task_mgr.client.describe_tasks.return_value = fixtures.FAILED_TASK_RESULT
   result = check_task.handler(check_task_event, context)
@@ -54,4 +64,77 @@ def test_check_task_failure(check_task, check_task_event, context):
   assert check_task.task_mgr.client.describe_tasks.called
   assert result['Status'] == 'FAILED'
   assert result['Reason'].startswith('A task failure occurred')
-  
\ No newline at end of file
+  
+
+def test_check_task_describes_in_batches(check_task, check_task_event, context):
+  task = fixtures.RUNNING_TASK_RESULT['tasks'][0]
+  task_arns = ['%s-%s' % (task['taskArn'], i) for i in range(250)]
+  check_task_event['Tasks'] = [dict(task, taskArn=arn) for arn in task_arns]
+  check_task.task_mgr.client.describe_tasks.side_effect = lambda cluster, tasks: {
+    'tasks': [dict(task, taskArn=arn) for arn in tasks],
+    'failures': []
+  }
+  result = check_task.handler(check_task_event, context)
+  batches = [c[1]['tasks'] for c in check_task.task_mgr.client.describe_tasks.call_args_list]
+  assert sorted(len(b) for b in batches) == [50, 100, 100]
+  assert [t['taskArn'] for t in result['Tasks']] == task_arns
+  assert result['Status'] == 'RUNNING'
+
+def test_check_task_stores_task_snapshots(check_task, check_task_event, context):
+  check_task.task_mgr.client.describe_tasks.return_value = fixtures.STOPPED_TASK_RESULT
+  result = check_task.handler(check_task_event, context)
+  assert result['Tasks'] == [{
+    'taskArn': fixtures.PHYSICAL_RESOURCE_ID,
+    'lastStatus': 'STOPPED',
+    'stoppedReason': 'Container exited',
+    'containers': [{'name': 'app', 'exitCode': 0}]
+  }]
+
+def test_check_task_stores_full_detail_on_request(check_task, check_task_event, context):
+  check_task_event['Detail'] = True
+  result = check_task.handler(check_task_event, context)
+  assert result['Tasks'][0]['containerInstanceArn'] == fixtures.RUNNING_TASK_RESULT['tasks'][0]['containerInstanceArn']
+
+def test_check_task_skips_stopped_tasks(check_task, check_task_event, context):
+  stopped = dict(fixtures.STOPPED_TASK_RESULT['tasks'][0], taskArn='stopped')
+  check_task_event['Tasks'] = [stopped] + check_task_event['Tasks']
+  result = check_task.handler(check_task_event, context)
+  assert check_task.task_mgr.client.describe_tasks.call_args[1]['tasks'] == [fixtures.PHYSICAL_RESOURCE_ID]
+  assert [t['taskArn'] for t in result['Tasks']] == ['stopped', fixtures.PHYSICAL_RESOURCE_ID]
+  assert result['Status'] == 'RUNNING'
+
+
+def test_create_tasks_starts_each_spec(create_tasks, create_task_event, context):
+  specs = [dict(create_task_event, TaskDefinition=u'task-%s' % i) for i in range(3)]
+  result = create_tasks.handler({'Specs': specs}, context)
+  started = sorted(c[1]['taskDefinition'] for c in create_tasks.create_task.task_mgr.client.run_task.call_args_list)
+  assert started == ['task-0', 'task-1', 'task-2']
+  assert [s['Status'] for s in result['Specs']] == ['PENDING'] * 3
+  assert result['Status'] == 'PENDING'
+
+def test_create_tasks_reports_status_per_spec(create_tasks, create_task_event, context):
+  specs = [create_task_event, {u'Cluster': u'cluster'}]
+  result = create_tasks.handler({'Specs': specs}, context)
+  assert [s['Status'] for s in result['Specs']] == ['PENDING', 'FAILED']
+  assert result['Specs'][1]['Reason'].startswith('One or more invalid event properties')
+  assert result['Status'] == 'PENDING'
+
+def test_check_tasks_skips_finished_specs(check_tasks, check_task_event, context):
+  stopped = dict(check_task_event, Status='STOPPED')
+  result = check_tasks.handler({'Specs': [stopped, check_task_event]}, context)
+  assert check_tasks.check_task.task_mgr.client.describe_tasks.call_count == 1
+  assert [s['Status'] for s in result['Specs']] == ['STOPPED', 'RUNNING']
+  assert result['Status'] == 'RUNNING'
+
+def test_check_tasks_fails_when_all_specs_finish(check_tasks, check_task_event, context):
+  check_tasks.check_task.task_mgr.client.describe_tasks.return_value = fixtures.FAILED_TASK_RESULT
+  stopped = dict(check_task_event, Status='STOPPED')
+  result = check_tasks.handler({'Specs': [stopped, check_task_event]}, context)
+  assert [s['Status'] for s in result['Specs']] == ['STOPPED', 'FAILED']
+  assert result['Status'] == 'FAILED'
+  assert result['Reason'] == 'One or more task specs failed: [1]'
+
+def test_batch_requires_specs(check_tasks, context):
+  result = check_tasks.handler({'Specs': []}, context)
+  assert result['Status'] == 'FAILED'
+  assert result['Reason'].startswith('One or more invalid event properties')
@@ -0,0 +1,51 @@
+import json
+import mock
+import pytest
+from lib import events
+from lib.events import SqsEventQueue, FileEventQueue, get_event_queue, wait_for_stopped
+
+TASK_ARN = 'arn:aws:ecs:us-west-2:123456789012:task/watched'
+OTHER_TASK_ARN = 'arn:aws:ecs:us-west-2:123456789012:task/other'
+
+def state_change(task_arn, status='STOPPED'):
+  return {'detail-type': 'ECS Task State Change', 'detail': {'taskArn': task_arn, 'lastStatus': status}}
+
+@pytest.fixture
+def sqs():
+  with mock.patch.dict(events.EVENT_QUEUES, clear=True), mock.patch('lib.events.get_client') as get_client:
+    yield get_client.return_value
+
+def test_sqs_queue_deletes_only_watched_task_messages(sqs):
+  sqs.receive_message.return_value = {'Messages': [
+    {'ReceiptHandle': 'watched', 'Body': json.dumps(state_change(TASK_ARN))},
+    {'ReceiptHandle': 'other', 'Body': json.dumps(state_change(OTHER_TASK_ARN))}
+  ]}
+  received = SqsEventQueue('https://sqs/queue').receive(5, task_arns=set([TASK_ARN]))
+  assert [e['detail']['taskArn'] for e in received] == [TASK_ARN, OTHER_TASK_ARN]
+  entries = sqs.delete_message_batch.call_args[1]['Entries']
+  assert [e['ReceiptHandle'] for e in entries] == ['watched']
+
+def test_sqs_queue_does_not_delete_unwatched_messages(sqs):
+  sqs.receive_message.return_value = {'Messages': [{'ReceiptHandle': 'other', 'Body': json.dumps(state_change(OTHER_TASK_ARN))}]}
+  SqsEventQueue('https://sqs/queue').receive(5, task_arns=set([TASK_ARN]))
+  assert not sqs.delete_message_batch.called
+
+def test_queues_are_created_once_per_url(sqs, tmpdir):
+  assert get_event_queue('https://sqs/queue') is get_event_queue('https://sqs/queue')
+  path = 'file://%s' % tmpdir.join('events.json')
+  queue = get_event_queue(path)
+  queue.put(state_change(TASK_ARN))
+  assert len(get_event_queue(path).receive(0)) == 1
+  assert get_event_queue(path).receive(0) == []
+
+def test_wait_stops_at_deadline_while_unrelated_events_arrive():
+  queue = mock.Mock()
+  queue.receive.return_value = [state_change(OTHER_TASK_ARN)]
+  with mock.patch('time.time', side_effect=[0, 1, 4, 9, 10]):
+    assert not wait_for_stopped(queue, [TASK_ARN], 10)
+  assert [c[0][0] for c in queue.receive.call_args_list] == [9, 6, 1]
+
+def test_wait_returns_once_watched_tasks_stop():
+  queue = mock.Mock()
+  queue.receive.side_effect = [[state_change(OTHER_TASK_ARN)], [state_change(TASK_ARN)]]
+  assert wait_for_stopped(queue, [TASK_ARN], 10)
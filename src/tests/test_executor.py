@@ -0,0 +1,107 @@
+import mock
+import pytest
+import threading
+import fixtures
+from collections import defaultdict
+from fixtures import task_mgr, ecs_tasks, cfn_mgr, context, update_event, delete_event
+from fake_endpoint import FakeEndpoint
+from benchmarks.fake_aws import Clock, FakeEcs, REAL_SLEEP
+from lib import submit, gather
+from lib.ecs import CONTAINER_INSTANCE_CACHE
+
+class GatedEcs(FakeEcs):
+  """
+  Fake ECS backend that signals when each operation is first requested.
+  Requests of a held operation after its first 'after' requests wait until another operation has started,
+  recording whether it did so within 5 seconds.
+  """
+  def __init__(self, *args, **kwargs):
+    super(GatedEcs, self).__init__(*args, **kwargs)
+    self.started = defaultdict(threading.Event)
+    self.holds = {}
+    self.waited = []
+
+  def hold(self, operation, until, after=1):
+    self.holds[operation] = (until, after)
+
+  def request(self, operation):
+    with self.lock:
+      started = self.started[operation]
+    started.set()
+    super(GatedEcs, self).request(operation)
+    until, after = self.holds.get(operation, (None, 0))
+    if until and self.calls[operation] > after:
+      with self.lock:
+        other = self.started[until]
+      self.waited.append(other.wait(5))
+
+# Fake ECS endpoint that does not throttle requests
+@pytest.fixture
+def endpoint():
+  endpoint = FakeEndpoint(GatedEcs(Clock(), instances=250, latency=0, rate=0)).start()
+  yield endpoint
+  endpoint.stop()
+
+def test_gather_returns_results_in_order():
+  assert gather([submit(lambda x: x * 2, i) for i in range(5)]) == [0, 2, 4, 6, 8]
+
+def test_gather_raises_error_once_all_futures_complete():
+  done = []
+  def fail():
+    raise ValueError('failed')
+  def finish():
+    REAL_SLEEP(0.05)
+    done.append(True)
+  with pytest.raises(ValueError):
+    gather([submit(fail), submit(finish)])
+  assert done == [True]
+
+def test_managers_have_async_variants(task_mgr):
+  future = task_mgr.describe_tasks_async(cluster=fixtures.CLUSTER_NAME, tasks=[fixtures.PHYSICAL_RESOURCE_ID])
+  assert future.result() == task_mgr.describe_tasks(cluster=fixtures.CLUSTER_NAME, tasks=[fixtures.PHYSICAL_RESOURCE_ID])
+  with pytest.raises(AttributeError):
+    task_mgr.missing_async
+  with pytest.raises(AttributeError):
+    task_mgr.missing
+
+def test_container_instances_are_described_while_listing(task_mgr, endpoint):
+  # The last page is only listed once the first pages are being described
+  endpoint.backend.hold('ListContainerInstances', until='DescribeContainerInstances', after=2)
+  task_mgr.client = endpoint.client('ecs')
+  CONTAINER_INSTANCE_CACHE.clear()
+  index = task_mgr.get_container_instance_index(fixtures.CLUSTER_NAME)
+  assert len(index) == 250
+  assert endpoint.backend.calls['ListContainerInstances'] == 3
+  assert endpoint.backend.calls['DescribeContainerInstances'] == 3
+  assert endpoint.backend.waited == [True]
+
+def test_tasks_are_stopped_while_listing_on_delete(ecs_tasks, delete_event, context, endpoint):
+  backend = endpoint.backend
+  backend.hold('ListTasks', until='StopTask')
+  delete_event['ResourceProperties']['Count'] = '150'
+  backend.create_tasks(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 150, ecs_tasks.create_task(delete_event)['StartedBy'])
+  ecs_tasks.task_mgr.client = endpoint.client('ecs')
+  with mock.patch('lib.throttle.API_RATE', 1000):
+    response = ecs_tasks.handle_delete(delete_event, context)
+  assert response['Status'] == 'SUCCESS'
+  assert backend.calls['StopTask'] == 150
+  assert all(t['stopped'] for t in backend.tasks.values())
+  assert backend.waited == [True]
+
+def test_stack_status_and_task_definitions_are_looked_up_concurrently_on_update(ecs_tasks, cfn_mgr, update_event, context, endpoint):
+  waited = []
+  # The stack status lookup only completes once a task definition lookup has started
+  def describe_stacks(StackName):
+    waited.append(endpoint.backend.started['DescribeTaskDefinition'].wait(5))
+    return {'Stacks': [dict(fixtures.DESCRIBE_STACKS_RESULT['Stacks'][0], StackStatus='UPDATE_IN_PROGRESS')]}
+  cfn_mgr.client.describe_stacks.side_effect = describe_stacks
+  ecs_tasks.cfn_mgr = cfn_mgr
+  ecs_tasks.task_mgr.client = endpoint.client('ecs')
+  update_event['ResourceProperties']['RunOnRollback'] = u'False'
+  update_event['ResourceProperties']['UpdateCriteria'] = fixtures.UPDATE_CRITERIA
+  update_event['ResourceProperties']['TaskDefinition'] = fixtures.NEW_TASK_DEFINITION_ARN
+  response = ecs_tasks.handle_update(update_event, context)
+  assert response['Status'] == 'SUCCESS'
+  assert waited == [True]
+  assert endpoint.backend.calls['DescribeTaskDefinition'] == 2
+  assert endpoint.backend.calls['RunTask'] == 0
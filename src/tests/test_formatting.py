@@ -0,0 +1,43 @@
+import mock
+import logging
+import datetime
+import fixtures
+from collections import OrderedDict
+from lib import formatting
+from lib.formatting import json_native, lazy_json, summarize_tasks
+
+def test_lazy_json_is_not_formatted_when_level_disabled():
+  log = logging.getLogger('test_formatting')
+  log.setLevel(logging.WARNING)
+  with mock.patch.object(formatting, 'format_json') as format_json:
+    log.info('Received event %s', lazy_json({'key': 'value'}))
+  assert not format_json.called
+
+def test_lazy_json_is_capped():
+  with mock.patch.object(formatting, 'MAX_LOG_LENGTH', 10):
+    output = str(lazy_json({'key': 'x' * 100}))
+  assert output.startswith('{"key": "x')
+  assert output.endswith('(101 characters truncated)')
+
+def test_summary_lists_limited_tasks():
+  task = fixtures.STOPPED_TASK_RESULT['tasks'][0]
+  summary = summarize_tasks({'tasks': [task] * 25, 'failures': []})
+  assert summary['count'] == 25
+  assert summary['statuses'] == {'STOPPED': 25}
+  assert len(summary['tasks']) == formatting.MAX_SUMMARY_ITEMS
+  assert summary['tasks'][0] == {'taskArn': task['taskArn'], 'lastStatus': 'STOPPED', 'exitCodes': [0]}
+  assert summary['truncated']
+
+def test_json_native_converts_only_non_native_values():
+  created = datetime.datetime(2017, 3, 17, 22, 8, 34)
+  unchanged = {'containers': [{'name': 'app', 'exitCode': 0}]}
+  event = {'Tasks': [{'createdAt': created}], 'Overrides': unchanged, 'Count': 1}
+  result = json_native(event)
+  assert result == {'Tasks': [{'createdAt': '2017-03-17T22:08:34'}], 'Overrides': unchanged, 'Count': 1}
+  assert result['Overrides'] is unchanged
+  assert event['Tasks'][0]['createdAt'] is created
+
+def test_json_native_keeps_dict_and_list_subclasses():
+  node = OrderedDict([('b', [datetime.datetime(2017, 1, 1)]), ('a', 1)])
+  assert json_native(node) == {'b': ['2017-01-01T00:00:00'], 'a': 1}
+  assert json_native([OrderedDict(a=1)]) == [{'a': 1}]
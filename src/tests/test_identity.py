@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from hashlib import md5
+from lib import task_id, is_task_arn, task_data
+from lib.identity import MAX_DATA_LENGTH
+
+STACK_ID = u'arn:aws:cloudformation:us-west-2:123456789012:stack/my-stack/4e9cd7f0-0c3a-11e8-b7e1-500c28b23699'
+
+def test_task_id_matches_digest_of_ascii_parts():
+  assert task_id(STACK_ID, u'MyEcsTask') == md5(STACK_ID + 'MyEcsTask').hexdigest()
+  assert task_id(str(STACK_ID), 'MyEcsTask') == task_id(STACK_ID, u'MyEcsTask')
+
+def test_task_id_handles_unicode():
+  assert len(task_id(STACK_ID, u'Tâche')) == 32
+  assert task_id(STACK_ID, u'Tâche') == task_id(STACK_ID.encode('utf-8'), u'Tâche'.encode('utf-8'))
+
+def test_is_task_arn():
+  assert is_task_arn('arn:aws:ecs:us-west-2:123456789012:task/96052dc0-a646-4068-86d5-4c947b9a88b5')
+  assert is_task_arn(u'arn:aws:ecs:us-west-2:123456789012:task/cluster/96052dc0a64640688')
+  assert not is_task_arn('a6cd5b8a1d0a2bcf15d0c0c7c31a9b8e')
+  assert not is_task_arn(None)
+
+def test_task_data_is_bounded():
+  arns = ['arn:aws:ecs:us-west-2:123456789012:task/cluster/%032x' % i for i in range(100)]
+  assert task_data(arns[:2]) == {'TaskArns': ','.join(arns[:2])}
+  assert len(','.join(arns)) > MAX_DATA_LENGTH
+  assert task_data(arns) == {}
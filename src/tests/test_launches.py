@@ -0,0 +1,100 @@
+import mock
+import copy
+import pytest
+import fixtures
+from fixtures import task_mgr, ecs_tasks, create_task, create_task_event, check_task, create_event, context, time, launch_store
+from cfn_lambda_handler import CfnLambdaExecutionTimeout
+from lib import load_checkpoint, enqueue, dispatch, finish_launch, QUEUED
+
+SPEC = {
+  'Cluster': fixtures.CLUSTER_NAME,
+  'TaskDefinition': fixtures.OLD_TASK_DEFINITION_ARN,
+  'Overrides': {},
+  'Count': 1,
+  'Instances': [],
+  'StartedBy': 'admin',
+  'Preflight': 'Wait',
+  'Detail': False
+}
+
+def queue(started_by, priority=0, expires=None):
+  return enqueue(dict(SPEC, StartedBy=started_by), priority, expires or fixtures.NOW + 3600)
+
+def started(task_mgr):
+  return [c[1]['startedBy'] for c in task_mgr.client.run_task.call_args_list]
+
+def test_launches_start_in_priority_then_fifo_order(task_mgr, launch_store):
+  launches = [queue('first'), queue('second'), queue('urgent', priority=1)]
+  dispatch(task_mgr, fixtures.CLUSTER_NAME)
+  assert started(task_mgr) == ['urgent', 'first', 'second']
+  assert [launch_store.get(i)['Status'] for i in launches] == ['LAUNCHED'] * 3
+
+def test_launches_are_limited_per_cluster(task_mgr, launch_store):
+  launches = [queue('first'), queue('second')]
+  with mock.patch('lib.launches.LAUNCH_CONCURRENCY', 1):
+    dispatch(task_mgr, fixtures.CLUSTER_NAME)
+    dispatch(task_mgr, fixtures.CLUSTER_NAME)
+    assert started(task_mgr) == ['first']
+    finish_launch(launches[0])
+    dispatch(task_mgr, fixtures.CLUSTER_NAME)
+  assert started(task_mgr) == ['first', 'second']
+
+def test_launches_wait_for_capacity_in_order(task_mgr, launch_store):
+  launches = [queue('first'), queue('second')]
+  task_mgr.client.run_task.return_value = copy.deepcopy(fixtures.TASK_FAILURE)
+  dispatch(task_mgr, fixtures.CLUSTER_NAME)
+  assert started(task_mgr) == ['first']
+  assert [launch_store.get(i)['Status'] for i in launches] == [QUEUED] * 2
+  task_mgr.client.run_task.return_value = copy.deepcopy(fixtures.START_TASK_RESULT)
+  dispatch(task_mgr, fixtures.CLUSTER_NAME)
+  assert started(task_mgr) == ['first', 'first', 'second']
+
+def test_partially_placed_launches_are_stopped_and_queued(task_mgr, launch_store):
+  launch = queue('partial')
+  task_mgr.client.run_task.return_value = dict(copy.deepcopy(fixtures.START_TASK_RESULT), failures=fixtures.TASK_FAILURE['failures'])
+  dispatch(task_mgr, fixtures.CLUSTER_NAME)
+  assert task_mgr.client.stop_task.call_args[1]['task'] == fixtures.PHYSICAL_RESOURCE_ID
+  assert launch_store.get(launch)['Status'] == QUEUED
+
+def test_expired_launches_are_not_started(task_mgr, launch_store):
+  launch = queue('expired', expires=fixtures.NOW - 1)
+  dispatch(task_mgr, fixtures.CLUSTER_NAME)
+  assert not task_mgr.client.run_task.called
+  assert launch_store.get(launch)['Status'] == 'EXPIRED'
+
+def test_queued_task_is_started_by_check_task(create_task, create_task_event, check_task, context, launch_store):
+  create_task.task_mgr.client.run_task.return_value = copy.deepcopy(fixtures.TASK_FAILURE)
+  create_task_event['Preflight'] = 'Wait'
+  result = create_task.handler(create_task_event, context)
+  assert result['Status'] == QUEUED
+  assert result['Tasks'] == []
+  check_task.task_mgr = create_task.task_mgr
+  assert check_task.handler(copy.deepcopy(result), context)['Status'] == QUEUED
+  create_task.task_mgr.client.run_task.return_value = copy.deepcopy(fixtures.START_TASK_RESULT)
+  result = check_task.handler(result, context)
+  assert result['Status'] == 'PENDING'
+  assert result['Tasks'][0]['taskArn'] == fixtures.PHYSICAL_RESOURCE_ID
+  assert launch_store.get(result['LaunchId'])['Status'] == 'LAUNCHED'
+  create_task.task_mgr.client.describe_tasks.return_value = fixtures.STOPPED_TASK_RESULT
+  assert check_task.handler(result, context)['Status'] == 'STOPPED'
+  assert launch_store.get(result['LaunchId'])['Status'] == 'FINISHED'
+
+def test_queued_resource_is_resumed_by_poll(ecs_tasks, create_event, context, time, launch_store):
+  client = ecs_tasks.task_mgr.client
+  client.run_task.return_value = copy.deepcopy(fixtures.TASK_FAILURE)
+  context.get_remaining_time_in_millis.return_value = 10000
+  create_event['ResourceProperties']['Preflight'] = 'Wait'
+  with pytest.raises(CfnLambdaExecutionTimeout) as e:
+    ecs_tasks.handle_create(create_event, context)
+  assert load_checkpoint(e.value.state)['Queued']
+  client.run_task.return_value = copy.deepcopy(fixtures.START_TASK_RESULT)
+  context.get_remaining_time_in_millis.return_value = 300000
+  poll_event = dict(create_event, EventState=e.value.state)
+  response = ecs_tasks.handle_poll(poll_event, context)
+  assert response['Status'] == 'SUCCESS'
+  assert response['PhysicalResourceId'] == fixtures.PHYSICAL_RESOURCE_ID
+  assert client.run_task.call_count == 2
+  assert launch_store.get(load_checkpoint(e.value.state)['LaunchId'])['Status'] == 'FINISHED'
+
+def test_queued_specs_are_pending_in_a_batch(task_mgr):
+  assert task_mgr.check_batch_status([{'Status': QUEUED}, {'Status': 'STOPPED'}]) == 'PENDING'
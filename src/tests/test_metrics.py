@@ -0,0 +1,64 @@
+import pytest
+import fixtures
+from fixtures import check_task, check_task_event, ecs_tasks, create_event, context, time
+from fixtures import create_task, create_tasks, create_task_event
+from botocore.exceptions import ClientError
+from cfn_lambda_handler import CfnLambdaExecutionTimeout
+from lib import MemorySink, set_sink
+
+@pytest.fixture
+def sink():
+  sink = MemorySink()
+  previous = set_sink(sink)
+  yield sink
+  set_sink(previous)
+
+# Returns the names of the metrics declared in an embedded metric format summary
+def declared(summary):
+  return [m['Name'] for m in summary['_aws']['CloudWatchMetrics'][0]['Metrics']]
+
+def test_summary_is_emitted_per_invocation(check_task, check_task_event, context, sink):
+  check_task.handler(check_task_event, context)
+  check_task.handler(check_task_event, context)
+  assert len(sink.summaries) == 2
+  summary = sink.summaries[-1]
+  assert summary['Handler'] == 'check_task.handler'
+  assert summary['api.ecs:describe_tasks.Count'] == 1
+  assert summary['ecs.describe_tasks.Count'] == 1
+  assert summary['validate_ecs.Count'] == 1
+  assert summary['serialize.Count'] == 1
+  assert all(name in summary for name in declared(summary))
+  assert 'Failed' not in summary
+
+def test_summary_records_retries_and_sleep_time(check_task, check_task_event, context, time, sink):
+  throttled = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'DescribeTasks')
+  check_task.task_mgr.client.describe_tasks.side_effect = [throttled, fixtures.RUNNING_TASK_RESULT]
+  check_task.handler(check_task_event, context)
+  summary = sink.summaries[-1]
+  assert summary['api.Throttles'] == 1
+  assert summary['api.Retries'] == 1
+  assert summary['api.ecs:describe_tasks.Count'] == 2
+  assert summary['sleep.Count'] == time.call_count
+  assert summary['sleep.Time'] == sum(c[0][0] for c in time.call_args_list) * 1000
+
+def test_summary_records_failures_and_reinvocations(ecs_tasks, create_event, context, time, sink):
+  context.get_remaining_time_in_millis.return_value = 1000
+  with pytest.raises(CfnLambdaExecutionTimeout):
+    ecs_tasks.handle_create(create_event, context)
+  assert sink.summaries[-1]['Handler'] == 'ecs_tasks.handle_create'
+  assert sink.summaries[-1]['Reinvoked'] == 1
+  assert sink.summaries[-1]['poll.Count'] == 1
+  create_event['ResourceProperties']['Count'] = 'invalid'
+  ecs_tasks.handle_create(create_event, context)
+  assert sink.summaries[-1]['Failed'] == 1
+
+def test_batch_invocation_emits_a_single_summary(create_tasks, create_task_event, context, sink):
+  specs = [dict(create_task_event, TaskDefinition=u'task-%s' % i) for i in range(4)] + [{u'Cluster': u'cluster'}]
+  result = create_tasks.handler({'Specs': specs}, context)
+  assert len(sink.summaries) == 1
+  summary = sink.summaries[0]
+  assert summary['Handler'] == 'create_tasks.handler'
+  assert summary['api.ecs:run_task.Count'] == 4
+  assert summary['validate_ecs.Count'] == 5
+  assert 'Failed' not in summary
+  assert result['Specs'][4]['Status'] == 'FAILED'
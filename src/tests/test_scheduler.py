@@ -0,0 +1,58 @@
+import pytest
+import mock
+import datetime
+from lib import scheduler
+from lib.scheduler import PollScheduler, record_timings, expected_completion
+from lib.utils import to_timestamp
+
+@pytest.fixture
+def timings():
+  with mock.patch.dict(scheduler.OBSERVED_TIMINGS, clear=True):
+    yield scheduler.OBSERVED_TIMINGS
+
+# Returns a task result for a single task with the given status and timestamps (in seconds)
+def task_result(status, created=None, started=None, stopped=None):
+  task = {'taskDefinitionArn': 'my-task:1', 'lastStatus': status}
+  for key, value in [('createdAt', created), ('startedAt', started), ('stoppedAt', stopped)]:
+    if value is not None:
+      task[key] = datetime.datetime.utcfromtimestamp(value)
+  return {'tasks': [task], 'failures': []}
+
+def test_intervals_back_off_to_maximum(timings):
+  with mock.patch('random.uniform', return_value=1):
+    schedule = PollScheduler(30)
+    intervals = [schedule.next_interval(task_result('RUNNING'), 0) for _ in range(6)]
+  assert intervals == [2, 4, 8, 16, 30, 30]
+
+def test_jitter_stays_within_bounds(timings):
+  schedule = PollScheduler(10)
+  intervals = [schedule.next_interval(task_result('RUNNING'), 0) for _ in range(50)]
+  assert all(2 <= i <= 10 for i in intervals)
+
+def test_final_interval_fills_remaining_time():
+  schedule = PollScheduler(60)
+  assert schedule.fit(60, 20000) == 15
+  assert schedule.fit(8, 20000) == 8
+  assert schedule.fit(60, 6000) is None
+
+def test_interval_targets_observed_completion(timings):
+  record_timings(task_result('STOPPED', created=1000, started=1010, stopped=1100))
+  assert timings['my-task:1'] == (10, 90)
+  assert expected_completion(task_result('RUNNING', created=2000, started=2010), 2050) == 50
+  assert expected_completion(task_result('PENDING', created=2000), 2005) == 95
+  with mock.patch('random.uniform', return_value=1):
+    assert PollScheduler(60).next_interval(task_result('RUNNING', created=2000, started=2010), 2090) == 10
+
+def test_overdue_tasks_back_off(timings):
+  record_timings(task_result('STOPPED', created=1000, started=1010, stopped=1100))
+  with mock.patch('random.uniform', return_value=1):
+    schedule = PollScheduler(30)
+    intervals = [schedule.next_interval(task_result('RUNNING', created=2000, started=2010), 3000) for _ in range(6)]
+  assert intervals == [2, 4, 8, 16, 30, 30]
+
+def test_to_timestamp():
+  assert to_timestamp('2017-03-17T22:08:34.500000+00:00') == 1489788514.5
+  assert to_timestamp('2017-03-17T15:08:34-07:00') == 1489788514
+  assert to_timestamp('2017-03-17T22:08:34Z') == 1489788514
+  assert to_timestamp(datetime.datetime(2017, 3, 17, 22, 8, 34)) == 1489788514
+  assert to_timestamp(None) is None
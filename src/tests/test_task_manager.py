@@ -0,0 +1,135 @@
+import pytest
+import fixtures
+from fixtures import task_mgr, time
+from botocore.exceptions import ClientError
+from lib import EcsTaskFailureError
+from lib.ecs import CONTAINER_INSTANCE_CACHE, MISSING_INSTANCE_CACHE
+
+TASK_ARNS = ['%s-%s' % (fixtures.PHYSICAL_RESOURCE_ID, i) for i in range(30)]
+
+# Returns a ClientError with the given error code
+def client_error(code, operation='StopTask'):
+  return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+# Returns a stop_task side effect that is throttled on the first call for each task
+def throttle_once():
+  throttled = set()
+  def stop_task(cluster, task, reason):
+    if task not in throttled:
+      throttled.add(task)
+      raise client_error('ThrottlingException')
+    return {'task': {'taskArn': task, 'lastStatus': 'RUNNING'}}
+  return stop_task
+
+def test_stop_tasks_retries_throttled_requests(task_mgr, time):
+  task_mgr.client.stop_task.side_effect = throttle_once()
+  results = task_mgr.stop_tasks(cluster=fixtures.CLUSTER_NAME, tasks=TASK_ARNS)
+  assert [r['taskArn'] for r in results] == TASK_ARNS
+  assert all(r['lastStatus'] == 'RUNNING' for r in results)
+  assert task_mgr.client.stop_task.call_count == 60
+
+def test_stop_tasks_returns_errors_per_task(task_mgr, time):
+  def stop_task(cluster, task, reason):
+    if task == TASK_ARNS[3]:
+      raise client_error('InvalidParameterException')
+    return {'task': {'taskArn': task, 'lastStatus': 'RUNNING'}}
+  task_mgr.client.stop_task.side_effect = stop_task
+  results = task_mgr.stop_tasks(cluster=fixtures.CLUSTER_NAME, tasks=TASK_ARNS)
+  assert [r['taskArn'] for r in results if 'error' in r] == [TASK_ARNS[3]]
+  assert task_mgr.client.stop_task.call_count == 30
+
+def test_stop_tasks_waits_for_stopped(task_mgr, time):
+  task_mgr.client.stop_task.side_effect = lambda cluster, task, reason: {'task': {'taskArn': task, 'lastStatus': 'RUNNING'}}
+  task_mgr.client.describe_tasks.side_effect = lambda cluster, tasks: {
+    'tasks': [{'taskArn': t, 'lastStatus': 'STOPPED'} for t in tasks], 'failures': []
+  }
+  results = task_mgr.stop_tasks(cluster=fixtures.CLUSTER_NAME, tasks=TASK_ARNS, wait=True)
+  assert all(r['lastStatus'] == 'STOPPED' for r in results)
+  assert task_mgr.client.describe_tasks.call_count == 1
+
+# Returns list_container_instances and describe_container_instances side effects for a cluster of EC2 instances
+def container_instances(count):
+  arns = ['arn:aws:ecs:us-west-2:123456789012:container-instance/%s' % i for i in range(count)]
+  pages = [{'containerInstanceArns': arns[i:i + 100], 'nextToken': str(i + 100)} for i in range(0, count, 100)]
+  pages[-1].pop('nextToken')
+  def describe(cluster, containerInstances):
+    return {'containerInstances': [{'containerInstanceArn': a, 'ec2InstanceId': 'i-%s' % a.split('/')[-1]} for a in containerInstances]}
+  return pages, describe, arns
+
+@pytest.fixture
+def cluster(task_mgr):
+  pages, describe, arns = container_instances(250)
+  task_mgr.client.list_container_instances.side_effect = lambda cluster, nextToken=None: pages[int(nextToken or 0) // 100]
+  task_mgr.client.describe_container_instances.side_effect = describe
+  CONTAINER_INSTANCE_CACHE.clear()
+  MISSING_INSTANCE_CACHE.clear()
+  yield arns
+
+def test_container_instance_index_is_cached(task_mgr, cluster):
+  assert task_mgr.get_container_instances(fixtures.CLUSTER_NAME, ['i-249', 'i-0']) == [cluster[249], cluster[0]]
+  assert task_mgr.get_container_instances(fixtures.CLUSTER_NAME, ['i-120']) == [cluster[120]]
+  assert task_mgr.client.list_container_instances.call_count == 3
+  assert task_mgr.client.describe_container_instances.call_count == 3
+
+def test_container_instance_index_refreshes_for_unknown_instances(task_mgr, cluster):
+  task_mgr.get_container_instances(fixtures.CLUSTER_NAME, ['i-0'])
+  assert task_mgr.get_container_instances(fixtures.CLUSTER_NAME, ['i-1000']) == []
+  assert task_mgr.client.list_container_instances.call_count == 6
+
+def test_container_instance_index_is_loaded_once_on_cold_cache(task_mgr, cluster):
+  assert task_mgr.get_container_instances(fixtures.CLUSTER_NAME, ['i-0', 'i-1000']) == [cluster[0]]
+  assert task_mgr.client.list_container_instances.call_count == 3
+
+def test_unknown_instances_are_not_looked_up_again(task_mgr, cluster):
+  task_mgr.get_container_instances(fixtures.CLUSTER_NAME, ['i-1000'])
+  assert task_mgr.get_container_instances(fixtures.CLUSTER_NAME, ['i-1000']) == []
+  assert task_mgr.client.list_container_instances.call_count == 3
+
+def test_start_task_resolves_ec2_instance_ids(task_mgr, cluster):
+  task_mgr.start_task(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 1, 'admin', ['i-7', cluster[3]])
+  assert task_mgr.client.start_task.call_args[1]['containerInstances'] == [cluster[7], cluster[3]]
+  with pytest.raises(EcsTaskFailureError):
+    task_mgr.start_task(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 1, 'admin', ['i-1000'])
+
+# Returns a run_task side effect that starts the requested number of tasks, failing on the given call
+def run_task(fail_call=None):
+  calls = []
+  def run(cluster, taskDefinition, overrides, count, startedBy):
+    calls.append(count)
+    if len(calls) == fail_call:
+      raise client_error('AccessDeniedException', 'RunTask')
+    return {'tasks': [{'taskArn': 'task-%s-%s' % (len(calls), i)} for i in range(count)], 'failures': []}
+  return run
+
+def test_start_task_fans_out_large_counts(task_mgr, time):
+  task_mgr.client.run_task.side_effect = run_task()
+  result = task_mgr.start_task(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 95, 'admin', [])
+  counts = sorted(c[1]['count'] for c in task_mgr.client.run_task.call_args_list)
+  assert counts == [5] + [10] * 9
+  assert len(result['tasks']) == 95
+  assert result['failures'] == []
+
+def test_start_task_aggregates_partial_failures(task_mgr, time):
+  task_mgr.client.run_task.side_effect = run_task(fail_call=2)
+  result = task_mgr.start_task(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 30, 'admin', [])
+  assert len(result['tasks']) == 20
+  assert [f['reason'] for f in result['failures']] == ['AccessDeniedException']
+
+def test_started_tasks_are_stopped_on_partial_failure(task_mgr, time):
+  task_mgr.client.run_task.side_effect = run_task(fail_call=2)
+  task_mgr.client.stop_task.side_effect = lambda cluster, task, reason: {'task': {'taskArn': task, 'lastStatus': 'RUNNING'}}
+  result = task_mgr.start_task(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 30, 'admin', [])
+  stopped = sorted(c[1]['task'] for c in task_mgr.client.stop_task.call_args_list)
+  assert stopped == sorted(t['taskArn'] for t in result['tasks'])
+  assert len(stopped) == 20
+
+def test_tasks_that_cannot_be_stopped_are_reported(task_mgr, time):
+  task_mgr.client.run_task.side_effect = run_task(fail_call=2)
+  task_mgr.client.stop_task.side_effect = client_error('AccessDeniedException', 'StopTask')
+  result = task_mgr.start_task(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 20, 'admin', [])
+  assert [f['reason'] for f in result['failures']] == ['AccessDeniedException'] + ['STOP_FAILED'] * 10
+
+def test_tasks_are_not_stopped_without_failures(task_mgr, time):
+  task_mgr.client.run_task.side_effect = run_task()
+  task_mgr.start_task(fixtures.CLUSTER_NAME, fixtures.OLD_TASK_DEFINITION_ARN, {}, 30, 'admin', [])
+  assert not task_mgr.client.stop_task.called
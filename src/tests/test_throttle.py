@@ -0,0 +1,71 @@
+import mock
+import pytest
+import fixtures
+from fixtures import create_task, create_task_event, context, time, now
+from botocore.exceptions import ClientError, ConnectionError
+from lib import throttle
+from lib.throttle import ThrottledClient, TokenBucket, begin_invocation, get_stats
+
+# Returns a ClientError with the given error code
+def client_error(code, operation='DescribeTasks'):
+  return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+@pytest.fixture
+def api(time):
+  throttle.BUCKETS.clear()
+  begin_invocation()
+  client = mock.Mock()
+  yield ThrottledClient(client, 'ecs')
+
+def test_throttled_requests_are_retried(api):
+  api.client.describe_tasks.side_effect = [client_error('ThrottlingException')] * 2 + [{'tasks': []}]
+  assert api.describe_tasks(cluster='cluster', tasks=['task']) == {'tasks': []}
+  assert api.client.describe_tasks.call_count == 3
+  assert get_stats() == {'ecs:describe_tasks': {'calls': 3, 'throttles': 2, 'errors': 0, 'retries': 2}}
+
+def test_throttled_requests_give_up_after_max_attempts(api):
+  api.client.describe_tasks.side_effect = client_error('ThrottlingException')
+  with pytest.raises(ClientError):
+    api.describe_tasks(cluster='cluster', tasks=['task'])
+  assert api.client.describe_tasks.call_count == throttle.MAX_ATTEMPTS
+  assert get_stats()['ecs:describe_tasks']['retries'] == throttle.MAX_ATTEMPTS - 1
+
+def test_throttled_requests_are_not_retried_past_remaining_time(api, context):
+  context.get_remaining_time_in_millis.return_value = throttle.SAFETY_MARGIN * 1000
+  begin_invocation(context)
+  api.client.describe_tasks.side_effect = client_error('ThrottlingException')
+  with pytest.raises(ClientError):
+    api.describe_tasks(cluster='cluster', tasks=['task'])
+  assert api.client.describe_tasks.call_count == 1
+
+def test_other_errors_are_not_retried(api):
+  api.client.describe_tasks.side_effect = client_error('AccessDeniedException')
+  with pytest.raises(ClientError):
+    api.describe_tasks(cluster='cluster', tasks=['task'])
+  assert api.client.describe_tasks.call_count == 1
+  assert get_stats()['ecs:describe_tasks']['throttles'] == 0
+
+def test_transient_errors_are_retried(api):
+  error = ClientError({'Error': {'Code': 'InternalError'}, 'ResponseMetadata': {'HTTPStatusCode': 503}}, 'DescribeTasks')
+  api.client.describe_tasks.side_effect = [error, {'tasks': []}]
+  assert api.describe_tasks(cluster='cluster', tasks=['task']) == {'tasks': []}
+  assert get_stats() == {'ecs:describe_tasks': {'calls': 2, 'throttles': 0, 'errors': 1, 'retries': 1}}
+
+def test_transient_errors_are_not_retried_in_legacy_mode(api):
+  api.client.describe_tasks.side_effect = ConnectionError(error='reset')
+  with mock.patch('lib.throttle.RETRY_MODE', 'legacy'), pytest.raises(ConnectionError):
+    api.describe_tasks(cluster='cluster', tasks=['task'])
+  assert api.client.describe_tasks.call_count == 1
+
+def test_token_bucket_waits_once_burst_is_used(time, now):
+  bucket = TokenBucket(rate=10, burst=3)
+  for _ in range(5):
+    bucket.acquire()
+  assert [round(c[0][0], 2) for c in time.call_args_list] == [0.1, 0.2]
+
+def test_create_task_retries_throttled_run_task(create_task, create_task_event, context, time):
+  throttle.BUCKETS.clear()
+  create_task.task_mgr.client.run_task.side_effect = [client_error('ThrottlingException', 'RunTask'), fixtures.START_TASK_RESULT]
+  result = create_task.handler(create_task_event, context)
+  assert result['Status'] == 'PENDING'
+  assert create_task.task_mgr.client.run_task.call_count == 2
@@ -0,0 +1,62 @@
+import mock
+import threading
+from lib.utils import paginate, paginated_response, chunks, concurrent_map
+
+# Returns a mock paginated API with the given number of pages of two items each
+def paged_api(pages):
+  def call(NextToken=None):
+    page = int(NextToken or 0)
+    response = {'items': [page * 2, page * 2 + 1]}
+    if page + 1 < pages:
+      response['NextToken'] = str(page + 1)
+    return response
+  return mock.Mock(side_effect=call)
+
+def test_paginated_response_combines_pages():
+  api = paged_api(3)
+  assert paginated_response(api, 'items') == [0, 1, 2, 3, 4, 5]
+  assert api.call_count == 3
+
+def test_paginated_response_handles_long_page_chains():
+  api = paged_api(5000)
+  assert len(paginated_response(api, 'items')) == 10000
+
+def test_paginate_stops_after_max_items():
+  api = paged_api(10)
+  assert list(paginate(api, 'items', max_items=3)) == [0, 1, 2]
+  assert api.call_count == 2
+
+def test_paginate_fetches_pages_lazily():
+  api = paged_api(10)
+  items = paginate(api, 'items')
+  assert next(items) == 0
+  assert api.call_count == 1
+
+def test_paginate_uses_token_key():
+  api = mock.Mock(side_effect=[{'items': [0], 'nextToken': 't'}, {'items': [1], 'NextToken': 'ignored'}])
+  assert list(paginate(api, 'items', token_key='nextToken')) == [0, 1]
+  assert api.call_args_list[1][1] == {'nextToken': 't'}
+
+def test_chunks():
+  assert chunks(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+  assert chunks([], 2) == []
+
+def test_concurrent_map_preserves_order():
+  assert concurrent_map(lambda i: i * 2, range(25)) == [i * 2 for i in range(25)]
+  assert concurrent_map(lambda i: i * 2, iter([3])) == [6]
+  assert concurrent_map(lambda i: i * 2, []) == []
+
+def test_concurrent_map_processes_items_while_iterating():
+  processed = threading.Event()
+  waited = []
+  def items():
+    yield 0
+    yield 1
+    waited.append(processed.wait(5))
+    yield 2
+  def func(i):
+    if i == 0:
+      processed.set()
+    return i * 2
+  assert concurrent_map(func, items()) == [0, 2, 4]
+  assert waited == [True]
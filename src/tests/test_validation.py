@@ -0,0 +1,25 @@
+from lib.validation import DictToString, validate_cfn, validate_ecs
+
+def test_string_overrides_are_not_copied():
+  overrides = {'containerOverrides': [{'name': 'app', 'command': ['manage.py', u'migrate']}]}
+  assert DictToString(overrides) is overrides
+
+def test_non_string_overrides_are_converted():
+  overrides = {'containerOverrides': [{'name': 'app', 'memory': 512}], 'taskRoleArn': 'role'}
+  result = DictToString(overrides)
+  assert result == {'containerOverrides': [{'name': 'app', 'memory': '512'}], 'taskRoleArn': 'role'}
+  assert overrides['containerOverrides'][0]['memory'] == 512
+
+def test_defaults_are_not_shared_between_events():
+  first = validate_cfn({'Cluster': 'cluster', 'TaskDefinition': 'task'})
+  first['Instances'].append('instance')
+  first['Overrides']['taskRoleArn'] = 'role'
+  second = validate_cfn({'Cluster': 'cluster', 'TaskDefinition': 'task'})
+  assert second['Instances'] == []
+  assert second['Overrides'] == {}
+  assert validate_ecs({'Cluster': 'cluster', 'TaskDefinition': 'task'})['Tasks'] == []
+
+def test_fail_fast_is_coerced_to_bool():
+  assert validate_cfn({'Cluster': 'cluster', 'TaskDefinition': 'task', 'FailFast': 'false'})['FailFast'] is False
+  assert validate_cfn({'Cluster': 'cluster', 'TaskDefinition': 'task', 'FailFast': 'true'})['FailFast'] is True
+  assert validate_cfn({'Cluster': 'cluster', 'TaskDefinition': 'task'})['FailFast'] is False